@@ -0,0 +1,103 @@
+import argparse
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import bot
+from bot import Bot
+from game import ChessBoard
+
+DEFAULT_DEPTH = 3
+
+_worker_bot = None  # One Bot per process, reused for every position it analyses
+
+
+def read_fens(stream):
+    """Yield one FEN per non-empty line of stream, skipping lines starting with '#'."""
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def analyse_fen(fen, depth=None, time_limit_ms=None):
+    """
+    Search one position and return a result dict with the best move, score, depth reached and node counts.
+    A FEN that can't be read comes back with an "error" entry instead of raising. Errors from the search itself
+    are engine bugs and propagate.
+    """
+    global _worker_bot
+    if _worker_bot is None:
+        _worker_bot = Bot()
+    if depth is None and time_limit_ms is None:
+        depth = DEFAULT_DEPTH
+
+    start = time.perf_counter()
+    try:
+        board = ChessBoard.from_fen(fen)
+    except ValueError as e:
+        return {"fen": fen, "error": f"{type(e).__name__}: {e}"}
+    score, move = _worker_bot.search(board, time_limit_ms=time_limit_ms, max_depth=depth or bot.MAX_PLY)
+    stats = _worker_bot.stats
+    return {
+        "fen": fen,
+        "move": ChessBoard.move_to_file_rank(move) if move not in (None, bot.NO_MOVE) else None,
+        "score": score,
+        "depth": _worker_bot.depth_reached,
+        "nodes": stats.nodes,
+        "qnodes": stats.qnodes,
+        "evals": stats.evals,
+        "seconds": round(time.perf_counter() - start, 6),
+    }
+
+
+def analyse_stream(fens, depth=None, time_limit_ms=None, workers=1, window=None):
+    """
+    Analyse an iterable of FENs lazily, yielding one result dict per FEN in input order.
+
+    With more than one worker, positions are searched in a process pool. At most `window` positions
+    (4 per worker by default) are read ahead of the output, so memory stays flat however long the input is.
+    """
+    if workers <= 1:
+        for fen in fens:
+            yield analyse_fen(fen, depth, time_limit_ms)
+        return
+
+    window = window or workers * 4
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for fen in fens:
+            pending.append(pool.submit(analyse_fen, fen, depth, time_limit_ms))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse FEN positions, one per line, and write JSON lines")
+    parser.add_argument("input", nargs="?", default="-", help="file of FEN lines ('-' or omitted for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="where to write the JSONL results ('-' for stdout)")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--depth", type=int, help=f"fixed search depth (default {DEFAULT_DEPTH})")
+    limit.add_argument("--time-ms", type=int, help="time budget per position in milliseconds")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for result in analyse_stream(read_fens(source), args.depth, args.time_ms, args.workers):
+            sink.write(json.dumps(result) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
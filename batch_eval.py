@@ -0,0 +1,172 @@
+import argparse
+import itertools
+import sys
+import time
+
+import numpy as np
+
+from batch import read_fens
+from game import (
+    ChessBoard, FEN_PIECES, COLOR_OFFSET, ROOK, QUEEN, KNIGHT, BISHOP,
+    FLAG_MASK, PROMOTION_FLAG, EN_PASSANT_FLAG, CASTLING_FLAG, new_move_buffer,
+)
+
+# Positions are encoded as one int8 per square (row * 8 + col, as in game.py): 0 for an empty square, otherwise
+# 1 + the piece's bitboard index (kind + color offset), so white pieces are 1-6 and black pieces 7-12
+PIECE_CODES = {symbol: FEN_PIECES[symbol][0].kind + COLOR_OFFSET[FEN_PIECES[symbol][1]] + 1 for symbol in FEN_PIECES}
+DEFAULT_CHUNK = 16384  # Positions scored per dot product, which bounds the one-hot planes to ~60 MB
+
+# WEIGHTS[plane * 64 + square] is what a piece on that plane and square adds to the evaluation: the same
+# value plus piece-square bonus the board keeps in psq_score, negative for black. Stored as float32 so the dot
+# product runs through BLAS; every partial sum is a whole number far below 2 ** 24, so it stays exact
+WEIGHTS = np.zeros(12 * 64, dtype=np.float32)
+for _symbol, (_piece_class, _color) in FEN_PIECES.items():
+    _plane = PIECE_CODES[_symbol] - 1
+    WEIGHTS[_plane * 64:(_plane + 1) * 64] = _piece_class.square_values[_color]
+_PLANES = np.arange(1, 13, dtype=np.int8)
+_PROMOTION_KINDS = np.array([QUEEN, ROOK, BISHOP, KNIGHT], dtype=np.int8)  # By the promotion code in a move
+
+
+def encode_board(board: ChessBoard):
+    """Encode a board as a length-64 int8 array."""
+    encoded = np.zeros(64, dtype=np.int8)
+    bitboards = board.bitboards
+    for index in range(12):
+        bb = bitboards[index]
+        while bb:
+            lsb = bb & -bb
+            encoded[lsb.bit_length() - 1] = index + 1
+            bb ^= lsb
+    return encoded
+
+
+def encode_fen(fen):
+    """Encode the piece placement of a FEN without setting up a board, the quick way in for large position files."""
+    encoded = np.zeros(64, dtype=np.int8)
+    square = 0
+    for char in fen.split(None, 1)[0]:
+        if char == "/":
+            continue
+        if char.isdigit():
+            square += int(char)
+        elif char in PIECE_CODES and square < 64:
+            encoded[square] = PIECE_CODES[char]
+            square += 1
+        else:
+            raise ValueError(f"Bad FEN piece placement in {fen!r}")
+    if square != 64:
+        raise ValueError(f"Bad FEN piece placement in {fen!r}")
+    return encoded
+
+
+def encode_boards(boards):
+    """Encode boards (ChessBoards or FEN strings) as an N x 64 int8 array."""
+    encoded = [encode_fen(board) if isinstance(board, str) else encode_board(board) for board in boards]
+    return np.stack(encoded) if encoded else np.zeros((0, 64), dtype=np.int8)
+
+
+def evaluate_batch(encoded, chunk=DEFAULT_CHUNK):
+    """
+    Score an N x 64 int8 array of positions, giving the same numbers as Bot.evaluate (material plus piece-square
+    score, white positive) as an int64 array. Each chunk is expanded into one-hot N x 768 piece planes and
+    scored with a single dot product against WEIGHTS.
+    """
+    encoded = np.asarray(encoded, dtype=np.int8).reshape(-1, 64)
+    scores = np.empty(len(encoded), dtype=np.int64)
+    for first in range(0, len(encoded), chunk):
+        block = encoded[first:first + chunk]
+        planes = block[:, None, :] == _PLANES[None, :, None]  # N x 12 x 64
+        scores[first:first + chunk] = np.rint(planes.reshape(len(block), 12 * 64).astype(np.float32) @ WEIGHTS)
+    return scores
+
+
+def evaluate_boards(boards, chunk=DEFAULT_CHUNK):
+    """Score many boards (ChessBoards or FEN strings) at once, the same as Bot.evaluate would one at a time."""
+    return evaluate_batch(encode_boards(boards), chunk)
+
+
+def encode_children(board: ChessBoard, moves):
+    """
+    Encode the position after each of moves, given encoded as by ChessBoard.generate_moves, as an N x 64 array.
+    The parent is encoded once and each child is derived from it with array operations, using the move flags
+    for promotions, en passant captures and the castling rook, so no move is played on the board.
+    """
+    codes = np.asarray(moves, dtype=np.int64)
+    children = np.repeat(encode_board(board)[None, :], len(codes), axis=0)
+    if not len(codes):
+        return children
+    rows = np.arange(len(codes))
+    start, end, flags = codes & 63, codes >> 6 & 63, codes & FLAG_MASK
+    moving = children[rows, start]
+    offset = COLOR_OFFSET[board.turn]
+
+    promoted = flags == PROMOTION_FLAG
+    moving = np.where(promoted, _PROMOTION_KINDS[codes >> 12 & 3] + offset + 1, moving).astype(np.int8)
+    children[rows, start] = 0
+    children[rows, end] = moving
+
+    en_passant = flags == EN_PASSANT_FLAG  # The captured pawn stands beside the start square, on the end file
+    children[rows[en_passant], (start & ~7 | end & 7)[en_passant]] = 0
+
+    castling = flags == CASTLING_FLAG
+    if castling.any():
+        rook_start = np.where(end > start, start | 7, start & ~7)[castling]
+        rook_end = ((start + end) // 2)[castling]
+        children[rows[castling], rook_start] = 0
+        children[rows[castling], rook_end] = ROOK + offset + 1
+    return children
+
+
+def evaluate_children(board: ChessBoard, moves=None):
+    """
+    Score the position after every move in one call, the same as Bot.evaluate after playing each. moves are
+    encoded moves, all the legal moves for the side to move by default. Returns (moves, scores) as lists/arrays
+    in the same order.
+    """
+    if moves is None:
+        buffer = new_move_buffer()
+        moves = buffer[:board.generate_moves(buffer)].tolist()
+    return moves, evaluate_batch(encode_children(board, moves))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score FEN positions, one per line, with the static evaluation")
+    parser.add_argument("input", nargs="?", default="-", help="file of FEN lines ('-' or omitted for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="where to write 'score fen' lines ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = sys.stdout if args.output == "-" else open(args.output, "w")
+    count = errors = 0
+    elapsed = 0.0
+    try:
+        # Read, score and write DEFAULT_CHUNK positions at a time, so memory stays flat however long the input is.
+        # A bad FEN gets an 'error fen' line, keeping the output in step with the input, and the rest carry on
+        fens = read_fens(source)
+        while chunk := list(itertools.islice(fens, DEFAULT_CHUNK)):
+            start = time.perf_counter()
+            encoded = []
+            for fen in chunk:
+                try:
+                    encoded.append(encode_fen(fen))
+                except ValueError as e:
+                    print(e, file=sys.stderr)
+                    encoded.append(None)
+            good = [row for row in encoded if row is not None]
+            scores = iter(evaluate_batch(np.stack(good)) if good else ())
+            elapsed += time.perf_counter() - start
+            for fen, row in zip(chunk, encoded):
+                sink.write(f"{next(scores)} {fen}\n" if row is not None else f"error {fen}\n")
+            count += len(chunk)
+            errors += len(chunk) - len(good)
+        print(f"{count} positions in {elapsed:.3f}s, {errors} bad", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
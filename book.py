@@ -0,0 +1,152 @@
+import argparse
+import mmap
+import struct
+import sys
+from collections import Counter
+
+from game import ChessBoard, decode_move
+
+# Every book entry is 12 bytes: the position's Zobrist key, the move as ChessBoard.encode_move packs it and how
+# often it was played there. Entries are sorted by key and then by weight, most played first, so one binary
+# search finds them all
+ENTRY = struct.Struct(">QHH")
+MAX_WEIGHT = 0xFFFF
+DEFAULT_MAX_PLY = 20
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file built by build_book. The file is memory-mapped rather than read, so opening
+    a book costs nothing and every process using the same file shares its pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = self.file.seek(0, 2)
+        if size % ENTRY.size:
+            self.file.close()
+            raise ValueError(f"{path} is not a book file, its size isn't a multiple of {ENTRY.size} bytes")
+        self.entries = size // ENTRY.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def _key_at(self, index):
+        return ENTRY.unpack_from(self.data, index * ENTRY.size)[0]
+
+    def lookup(self, key):
+        """Return [(move, weight), ...] for the position with this Zobrist key, most played first."""
+        low, high = 0, self.entries
+        while low < high:  # Find the first entry with this key
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        for index in range(low, self.entries):
+            entry_key, code, weight = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((decode_move(code), weight))
+        return found
+
+    def choose(self, board: ChessBoard, rng=None):
+        """
+        Pick a book move for the side to move, or None when the position isn't in the book. Without rng the
+        most played move is returned, otherwise one is drawn at random in proportion to how often it was played.
+        Moves that aren't legal here (a different position with the same key) are ignored.
+        """
+        entries = self.lookup(board.zobrist_key)
+        if not entries:
+            return None
+        legal = set(board.legal_moves())
+        entries = [(move, weight) for move, weight in entries if move in legal]
+        if not entries:
+            return None
+        if rng is None:
+            return entries[0][0]
+        return rng.choices([move for move, _ in entries], weights=[weight for _, weight in entries])[0]
+
+    def close(self):
+        if self.entries:
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_lines(stream):
+    """
+    Yield the move list of every line in stream, one game or opening line per line, moves written the way
+    play_vs_bot logs them (E2E4, A7A8q) and separated by spaces. Blank lines and lines starting with '#' are skipped.
+    """
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line.split()
+
+
+def build_book(lines, max_ply=DEFAULT_MAX_PLY):
+    """
+    Play every move sequence in lines from the starting position and count how often each move was played in
+    each position, over the first max_ply plies. Returns the sorted book file contents as bytes.
+    Raises ValueError naming the line for a move that can't be read or isn't legal.
+    """
+    counts = Counter()
+    for number, moves in enumerate(lines, start=1):
+        board = ChessBoard()
+        for ply, text in enumerate(moves[:max_ply]):
+            try:
+                move = ChessBoard.file_rank_to_move(text)
+            except ValueError as e:
+                raise ValueError(f"Line {number}: {e}") from None
+            if move not in board.legal_moves():
+                raise ValueError(f"Line {number}: {text} isn't legal after {' '.join(moves[:ply]) or 'the start'}")
+            counts[board.zobrist_key, board.encode_move(move)] += 1
+            board.make_move(move)
+
+    entries = sorted(((key, code, min(count, MAX_WEIGHT)) for (key, code), count in counts.items()),
+                     key=lambda entry: (entry[0], -entry[2], entry[1]))
+    return b"".join(ENTRY.pack(*entry) for entry in entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query opening books")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from a file of move sequences, one line per game")
+    build.add_argument("input", help="file of move sequences ('-' for stdin)")
+    build.add_argument("-o", "--output", default="book.bin", help="book file to write")
+    build.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY, help="how many plies of each line to keep")
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book", help="book file")
+    probe.add_argument("--fen", help="position to look up (default: the starting position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        source = sys.stdin if args.input == "-" else open(args.input)
+        try:
+            data = build_book(read_lines(source), args.max_ply)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        with open(args.output, "wb") as f:
+            f.write(data)
+        print(f"{len(data) // ENTRY.size} entries written to {args.output}")
+    else:
+        board = ChessBoard.from_fen(args.fen) if args.fen else ChessBoard()
+        with OpeningBook(args.book) as book:
+            for move, weight in book.lookup(board.zobrist_key):
+                print(f"{ChessBoard.move_to_file_rank(move)}  {weight}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,57 @@
-from game import ChessBoard, Piece, BLACK, WHITE
-
-eval_count = 0
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from book import OpeningBook
+from game import (
+    ChessBoard, Piece, BLACK, WHITE, SQUARE_POS, MOVE_NONE, FLAG_MASK, PROMOTION_FLAG, EN_PASSANT_FLAG, PROMOTION_PIECES,
+    decode_move, move_code_to_file_rank, new_move_buffer,
+)
+from stats import SearchStats
+from tablebase import Tablebase, DEFAULT_DIRECTORY as DEFAULT_TABLEBASE, DRAW
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MAX_PLY = 64
+MATE_SCORE = 100_000  # Score of delivering mate now, well clear of any material total. Later mates score a ply less each
+MATE_BOUND = MATE_SCORE - 1000  # Scores beyond this are mates, however deep quiescence went
+TIME_CHECK_INTERVAL = 64  # Nodes, quiescence included, between clock checks (and sample_hook calls) during a search
+NO_MOVE = ((-1, -1), (-1, -1))  # Returned as the best move when there is none to report
+DEFAULT_BOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # Built with `python book.py build openings.txt`
+
+# Move ordering scores. Captures come first (most valuable victim, then least valuable attacker),
+# then promotions, then the quiet moves that caused cutoffs at the same ply (killer moves).
+# The best move stored in the transposition table beats all of them
+TT_MOVE_SCORE = 10_000_000
+CAPTURE_SCORE = 1_000_000
+PROMOTION_SCORE = 500_000
+KILLER_SCORE = 100_000
+PROMOTION_VALUES = {"q": 900, "r": 500, "b": 330, "n": 320}
+DELTA_MARGIN = 200  # Quiescence skips a capture that can't lift the score to alpha even with this much to spare
 
 class Bot:
+    def __init__(self, tt_size_mb=16, debug=False, book=None, tablebase=None, quiescence=True, profile=False):
+        self.debug = debug  # Check the board's incremental score against a full rescan at every evaluation
+        self.use_quiescence = quiescence  # Search captures past the horizon instead of evaluating leaves as they stand
+        self.stats = SearchStats()  # Counters for the current or last search, reset by search() and parallel_search()
+        self.profile = profile  # Run search() and parallel_search() under cProfile, with the results in the stats report
+        self.sample_hook = None  # Called with self.stats every TIME_CHECK_INTERVAL nodes, e.g. to report progress
+        self.iteration_hook = None  # Called with (depth, score, move) after each completed iteration of search()
+        self.killers = [[MOVE_NONE, MOVE_NONE] for _ in range(MAX_PLY)]  # Two most recent killer moves per ply
+        self.move_buffers = []  # One move buffer per ply, reused by every node searched at that ply
+        self.tt = TranspositionTable(tt_size_mb)  # Results of earlier searches, keyed by board.zobrist_key
+        self.stopped = False  # Set by stop() or when the time budget runs out; minimax then unwinds without storing anything
+        self.deadline = None  # time.perf_counter() value at which a timed search stops
+        self.node_limit = None  # Node count, quiescence included, at which search() stops
+        self.pv_move = MOVE_NONE  # Best root move of the last completed iteration, searched first in the next one
+        self.depth_reached = 0  # Depth of the last completed iteration of search()
+        self.pool = None  # Worker processes for parallel_search, started on first use
+        self.pool_workers = None  # How many processes self.pool was started with
+        self.pool_context = None  # multiprocessing context for starting the pool, the platform default if None
+        self.book = OpeningBook(book) if isinstance(book, str) else book  # Consulted by search() before searching
+        self.tablebase = Tablebase(tablebase) if isinstance(tablebase, str) else tablebase  # Probed by minimax in small endings
+
     def get_piece_val(self, board, pos):
         """
         This funciton should return the value of a piece in a given position in the gien board
@@ -10,60 +59,474 @@ class Bot:
 
         piece = board.get_piece(pos)
         row, col = pos
-        if isinstance(piece, Piece):  # Check if the piece is a pawn
+        if isinstance(piece, Piece):  # Check if the square holds a piece
             if piece.color == "black":
-                return -(piece.bonus[::-1][row][col] + piece.value)
+                return -(piece.pst[BLACK][row * 8 + col] + piece.value)  # Black's table is stored pre-mirrored
             elif piece.color == "white":
-                return piece.bonus[row][col] + piece.value
+                return piece.pst[WHITE][row * 8 + col] + piece.value
         return 0  # Default if no bonus is applicable
         
     def evaluate(self, board):
-        global eval_count
-        eval_count += 1
+        self.stats.evals += 1
 
+        # The board keeps the material and piece-square total up to date as pieces move
+        if self.debug:
+            assert board.psq_score == self.evaluate_full(board), (board.get_fen(), board.psq_score, self.evaluate_full(board))
+        return board.psq_score
+
+    def evaluate_full(self, board):
+        """Score the board by adding up every piece, the slow reference for the incremental score."""
         score = 0
-        for row in range(8):
-            for col in range(8):
-                score += self.get_piece_val(board, (row, col))
+        for pos, _ in board.pieces():  # Empty squares are worth nothing, so only visit occupied ones
+            score += self.get_piece_val(board, pos)
         return score
 
-    def minimax(self, board: ChessBoard, depth=0, white_turn=False):
-        if depth == 0 or board.is_checkmate():
-            return self.evaluate(board), (-1, -1)
-
-        valid_moves = []
-        for row in range(8):
-            for col in range(8):
-                if (piece := board.get_piece((row, col))) != " " and (
-                    (piece.color == WHITE and white_turn)
-                    or (piece.color == BLACK and not white_turn)
-                ):
-                    moves = board.get_valid_moves((row, col))
-                    if moves:
-                        valid_moves.extend(list(map(lambda x: ((row, col), x), moves)))
+    def order_moves(self, board, moves, ply=0, tt_move=MOVE_NONE):
+        """Sort a list of encoded moves in place so the ones most likely to cause a cutoff are searched first."""
+        killers = self.killers[ply] if ply < MAX_PLY else ()
+        squares = board.board
+
+        def score(move):
+            if move == tt_move:
+                return TT_MOVE_SCORE
+            end = move >> 6 & 63
+            victim = squares[end >> 3][end & 7]
+            if victim != " ":
+                start = move & 63
+                return CAPTURE_SCORE + victim.value * 10 - squares[start >> 3][start & 7].value
+            flag = move & FLAG_MASK
+            if flag == EN_PASSANT_FLAG:
+                return CAPTURE_SCORE + 100 * 10 - 100
+            if flag == PROMOTION_FLAG:
+                return PROMOTION_SCORE + PROMOTION_VALUES[PROMOTION_PIECES[move >> 12 & 3]]
+            if move in killers:
+                return KILLER_SCORE
+            return 0
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    def _move_buffer(self, ply):
+        buffers = self.move_buffers
+        while len(buffers) <= ply:  # Quiescence can go past MAX_PLY, so the buffers grow as deeper plies turn up
+            buffers.append(new_move_buffer())
+        return buffers[ply]
+
+    def store_killer(self, move, ply):
+        if ply < MAX_PLY and self.killers[ply][0] != move:
+            self.killers[ply][1] = self.killers[ply][0]
+            self.killers[ply][0] = move
+
+    def minimax(self, board: ChessBoard, depth=0, white_turn=False, alpha=float("-inf"), beta=float("inf"), ply=0):
+        """
+        Alpha-beta search. White maximises and black minimises the evaluation; branches that can't change
+        the result inside the (alpha, beta) window are cut off. Returns (score, best move), the move encoded as by
+        ChessBoard.generate_moves and MOVE_NONE when there is none.
+
+        Being mated scores MATE_SCORE less the ply it happens at against the side to move, so nearer mates
+        are preferred. Stalemate, a position repeated from the game or the search path and the fifty-move rule score 0.
+        """
+        stats = self.stats
+        stats.nodes += 1
+
+        if (stats.nodes + stats.qnodes) % TIME_CHECK_INTERVAL == 0:
+            self._checkpoint()
+        if self.stopped:
+            return 0, MOVE_NONE
+
+        # Below the tablebase's piece count the exact result is a lookup away. The root still searches its
+        # moves so there is a move to play, picking the fastest mate among them
+        if self.tablebase is not None and ply > 0 and board.occupied.bit_count() <= self.tablebase.max_pieces:
+            found = self.tablebase.probe(board)
+            if found is not None:
+                stats.tb_hits += 1
+                result, plies = found
+                score = 0 if result == DRAW else result * (MATE_SCORE - ply - plies)  # For the side to move
+                return (score if white_turn else -score), MOVE_NONE
+
+        # Draws by rule end the line. Going round in a circle can't be better than the first time round, and
+        # the fifty-move draw only waits to check the move that reached it didn't mate
+        if ply > 0:
+            if board.is_repetition():
+                return 0, MOVE_NONE
+            if board.halfmove_clock >= 100:
+                stats.mate_tests += 1
+                if not board.is_checkmate():
+                    return 0, MOVE_NONE
+
+        if depth == 0:
+            stats.leaves += 1
+            if self.use_quiescence:
+                return self.quiescence(board, white_turn, alpha, beta, ply), MOVE_NONE
+            return self.evaluate(board), MOVE_NONE
+
+        # A stored result for this position searched to the same depth can narrow the window or answer
+        # outright. Deeper results are not reused, which keeps a fixed-depth score the same whatever order
+        # positions were reached in (parallel_search relies on that). The stored best move goes first either way
+        alpha_orig, beta_orig = alpha, beta
+        tt_move = MOVE_NONE
+        stats.tt_probes += 1
+        entry = self.tt.probe(board.zobrist_key)
+        if entry is not None:
+            stats.tt_hits += 1
+            _, entry_depth, flag, score, tt_move = entry
+            score = _score_from_tt(score, ply)
+            if entry_depth == depth and ply > 0:
+                if flag == EXACT:
+                    stats.tt_cutoffs += 1
+                    return score, tt_move
+                if flag == LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    stats.tt_cutoffs += 1
+                    return score, tt_move
+
+        stats.movegen_calls += 1
+        buffer = self._move_buffer(ply)
+        count = board.generate_moves(buffer, WHITE if white_turn else BLACK)
+        if not count:
+            return self.terminal_score(board, white_turn, ply), MOVE_NONE
+        if ply == 0 and self.pv_move != MOVE_NONE:
+            tt_move = self.pv_move
+        valid_moves = self.order_moves(board, buffer[:count].tolist(), ply, tt_move)
 
         ret = float("-inf") if white_turn else float("inf")
-        ret_move = ((-1, -1), (-1, -1))
+        ret_move = MOVE_NONE
         for move in valid_moves:
-            clone = board.clone()
-            clone.move_piece(*move, choice="q")
-            val, _ = self.minimax(clone, depth - 1, not white_turn)
+            stats.make_moves += 1
+            undo = board.make_move_code(move)
+            val, _ = self.minimax(board, depth - 1, not white_turn, alpha, beta, ply + 1)
+            board.unmake_move(undo)
+            if self.stopped:  # The score of an interrupted subtree means nothing, leave without storing it
+                return ret, ret_move
 
             if (val < ret and not white_turn) or (val > ret and white_turn):
                 ret = val
                 ret_move = move
 
+            if white_turn:
+                alpha = max(alpha, val)
+            else:
+                beta = min(beta, val)
+            if alpha >= beta:
+                stats.cutoffs += 1
+                if undo[4] == " " and move & FLAG_MASK != PROMOTION_FLAG:  # Only quiet moves become killers, captures are ordered first anyway
+                    self.store_killer(move, ply)
+                break
+
+        if ret <= alpha_orig:
+            flag = UPPER  # Every move failed low, the true score is at most ret
+        elif ret >= beta_orig:
+            flag = LOWER  # Cut off, the true score is at least ret
+        else:
+            flag = EXACT
+        self.tt.store(board.zobrist_key, depth, flag, _score_to_tt(ret, ply), ret_move)
+
         return ret, ret_move
 
+    def terminal_score(self, board: ChessBoard, white_turn, ply):
+        """Score a position with no legal moves: mate against the side to move if it is in check, else stalemate."""
+        self.stats.mate_tests += 1
+        if not board.is_in_check(WHITE if white_turn else BLACK):
+            return 0
+        return -(MATE_SCORE - ply) if white_turn else MATE_SCORE - ply
+
+    def quiescence(self, board: ChessBoard, white_turn, alpha, beta, ply=0):
+        """
+        Search captures and promotions only, until the position is quiet, so a leaf isn't scored in the middle
+        of an exchange. The side to move may also stand pat on the static evaluation instead of capturing.
+        Captures are tried best first by static exchange evaluation; ones that lose material, or that couldn't
+        reach alpha even winning the captured piece outright (delta pruning), are skipped.
+        """
+        stats = self.stats
+        stats.qnodes += 1
+
+        if (stats.nodes + stats.qnodes) % TIME_CHECK_INTERVAL == 0:
+            self._checkpoint()
+        if self.stopped:
+            return 0
+
+        stand_pat = self.evaluate(board)
+        if white_turn:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+
+        stats.movegen_calls += 1
+        buffer = self._move_buffer(ply)
+        count = board.generate_moves(buffer, WHITE if white_turn else BLACK)
+        if not count:
+            return self.terminal_score(board, white_turn, ply)
+        captures = []
+        squares = board.board
+        for i in range(count):
+            move = buffer[i]
+            end = move >> 6 & 63
+            victim = squares[end >> 3][end & 7]
+            flag = move & FLAG_MASK
+            if victim != " ":
+                gain = victim.value
+            elif flag == EN_PASSANT_FLAG:
+                gain = 100
+            elif flag == PROMOTION_FLAG:
+                gain = 0
+            else:
+                continue
+            if flag == PROMOTION_FLAG:
+                if move >> 12 & 3:  # Underpromotions are never the quiet-making move (code 0 is the queen)
+                    continue
+                gain += PROMOTION_VALUES["q"] - 100
+            if (stand_pat + gain + DELTA_MARGIN <= alpha) if white_turn else (stand_pat - gain - DELTA_MARGIN >= beta):
+                continue
+            exchange = board.static_exchange(SQUARE_POS[move & 63], SQUARE_POS[end])
+            if exchange < 0 and flag != PROMOTION_FLAG:
+                continue
+            captures.append((exchange, move))
+        captures.sort(key=lambda capture: capture[0], reverse=True)
+
+        ret = stand_pat
+        for _, move in captures:
+            stats.make_moves += 1
+            undo = board.make_move_code(move)
+            val = self.quiescence(board, not white_turn, alpha, beta, ply + 1)
+            board.unmake_move(undo)
+            if self.stopped:
+                return ret
+
+            if white_turn:
+                ret = max(ret, val)
+                alpha = max(alpha, val)
+            else:
+                ret = min(ret, val)
+                beta = min(beta, val)
+            if alpha >= beta:
+                stats.cutoffs += 1
+                break
+        return ret
+
+    def _checkpoint(self):
+        """Runs every TIME_CHECK_INTERVAL nodes: stop once past the deadline or node limit, and hand the stats to sample_hook."""
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        if self.node_limit is not None and self.stats.nodes + self.stats.qnodes >= self.node_limit:
+            self.stopped = True
+        if self.sample_hook is not None:
+            self.sample_hook(self.stats)
+
+    def search(self, board: ChessBoard, time_limit_ms=None, max_depth=MAX_PLY, node_limit=None):
+        """
+        Iterative deepening search for the side to move. Searches depth 1, 2, ... up to max_depth, each
+        iteration starting from the previous best move, until time_limit_ms runs out, about node_limit nodes
+        have been searched (it is checked every TIME_CHECK_INTERVAL nodes) or stop() is called.
+        Returns (score, best move) from the deepest iteration that finished, with the counters and the time
+        taken by each iteration in self.stats. Limits that run out before depth 1 has searched a single root move
+        fall back to the first move in search order, scored by the static evaluation, so there is always a legal
+        move to play when one exists; NO_MOVE is returned only for a mate or stalemate.
+        A position found in the opening book is answered straight from it, with the static evaluation as the score.
+        """
+        self.stats.reset()
+        if self.book is not None:
+            move = self.book.choose(board)
+            if move is not None:
+                self.depth_reached = 0
+                self.stats.finish()
+                return board.psq_score, move
+
+        if self.profile:
+            self.stats.start_profile()
+        self.stopped = False
+        self.deadline = None if time_limit_ms is None else time.perf_counter() + time_limit_ms / 1000
+        self.node_limit = node_limit
+        self.pv_move = MOVE_NONE
+        self.depth_reached = 0
+        self.killers = [[MOVE_NONE, MOVE_NONE] for _ in range(MAX_PLY)]
+        white_turn = board.turn == WHITE
+
+        buffer = self._move_buffer(0)
+        count = board.generate_moves(buffer)
+        if count:
+            entry = self.tt.probe(board.zobrist_key)
+            fallback = self.order_moves(board, buffer[:count].tolist(), 0, entry[4] if entry is not None else MOVE_NONE)[0]
+            fallback_score = self.evaluate(board)
+        else:
+            fallback, fallback_score = MOVE_NONE, self.terminal_score(board, white_turn, 0)
+
+        best_score, best_move = None, None
+        for depth in range(1, max_depth + 1):
+            score, move = self.minimax(board, depth, white_turn)
+            if self.stopped:
+                if best_move is None and move != MOVE_NONE:  # Stopped during depth 1, a partial answer beats none
+                    best_score, best_move = score, move
+                break
+            best_score, best_move = score, move
+            self.pv_move = move
+            self.depth_reached = depth
+            self.stats.record_depth(depth, score, move_code_to_file_rank(move) if move != MOVE_NONE else None)
+            if self.iteration_hook is not None:
+                self.iteration_hook(depth, score, _public_move(move))
+            if move == MOVE_NONE:  # No legal moves, nothing deeper to find
+                break
+
+        if best_move is None:
+            best_score, best_move = fallback_score, fallback
+        self.deadline = None
+        self.node_limit = None
+        self.stats.finish()
+        self.stats.stop_profile()
+        return best_score, _public_move(best_move)
+
+    def principal_variation(self, board: ChessBoard, max_length=MAX_PLY):
+        """
+        The line the last search expects, read back from the transposition table by following each
+        position's stored best move. Stops at a move that isn't there or isn't legal, or at a repeated position.
+        """
+        line = []
+        undos = []
+        seen = set()
+        buffer = new_move_buffer()
+        while len(line) < max_length and board.zobrist_key not in seen:
+            seen.add(board.zobrist_key)
+            entry = self.tt.probe(board.zobrist_key)
+            if entry is None or entry[4] == MOVE_NONE or entry[4] not in buffer[:board.generate_moves(buffer)]:
+                break
+            line.append(decode_move(entry[4]))
+            undos.append(board.make_move_code(entry[4]))
+        for undo in reversed(undos):
+            board.unmake_move(undo)
+        return line
+
+    def stop(self):
+        """Stop a running search() from another thread. It returns the last completed iteration's result."""
+        self.stopped = True
+
+    def parallel_search(self, board: ChessBoard, depth, workers=None):
+        """
+        Fixed-depth search with the root moves split across a process pool. Returns the same (score, move)
+        as minimax(board, depth, ...) for the side to move.
+
+        The first root move is searched here to get a bound, then every other root move is sent to a worker
+        as the board's FEN plus the move, searched against that bound. Moves that can't beat it fail low
+        quickly, and the first move in search order with the best exact score wins, as in minimax.
+        The pool is started again when workers differs from the last call.
+        """
+        workers = workers or os.cpu_count() or 1
+        if self.pool is not None and self.pool_workers != workers:
+            self.pool.shutdown()
+            self.pool = None
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=self.pool_context)
+            self.pool_workers = workers
+        # A search() that was stopped or ran out of time leaves its limits behind, and minimax would stop at once
+        self.stopped = False
+        self.deadline = None
+        self.node_limit = None
+        stats = self.stats
+        stats.reset()
+        if self.profile:
+            stats.start_profile()  # Only sees this process; the workers' time shows up as waiting on results
+        white_turn = board.turn == WHITE
+        stats.movegen_calls += 1
+        buffer = self._move_buffer(0)
+        moves = buffer[:board.generate_moves(buffer)].tolist()
+        if depth == 0 or not moves:
+            score, move = self.minimax(board, depth, white_turn)
+            stats.finish()
+            stats.stop_profile()
+            return score, _public_move(move)
+
+        entry = self.tt.probe(board.zobrist_key)
+        self.order_moves(board, moves, 0, entry[4] if entry is not None else MOVE_NONE)
+
+        stats.make_moves += 1
+        undo = board.make_move_code(moves[0])
+        best_score, _ = self.minimax(board, depth - 1, not white_turn, ply=1)
+        board.unmake_move(undo)
+        best_move = moves[0]
+
+        fen = board.get_fen()
+        alpha, beta = (best_score, float("inf")) if white_turn else (float("-inf"), best_score)
+        tablebase = self.tablebase.directory if self.tablebase is not None else None
+        futures = [
+            self.pool.submit(_search_root_move, fen, move, depth, alpha, beta, tablebase, self.use_quiescence, board.key_history)
+            for move in moves[1:]
+        ]
+        for move, future in zip(moves[1:], futures):  # Collected in search order, so ties go to the earlier move
+            score, counts = future.result()
+            stats.merge(counts)
+            if (score > best_score and white_turn) or (score < best_score and not white_turn):
+                best_score, best_move = score, move
+        stats.record_depth(depth, best_score, move_code_to_file_rank(best_move))
+        stats.finish()
+        stats.stop_profile()
+        return best_score, decode_move(best_move)
+
+    def close(self):
+        """Shut down the parallel_search worker pool and close the opening book and tablebase."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+
+
+def _public_move(code):
+    """Moves leave the search as tuples, with NO_MOVE when there is none."""
+    return decode_move(code) if code != MOVE_NONE else NO_MOVE
+
+
+def _score_to_tt(score, ply):
+    """Mate scores count plies from the root. Store them counted from the position instead, so they hold wherever it recurs."""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+_worker_bot = None  # One Bot per worker process, so its transposition table carries over between root moves
+
+
+def _search_root_move(fen, move, depth, alpha, beta, tablebase=None, quiescence=True, key_history=()):
+    global _worker_bot
+    if _worker_bot is None:
+        _worker_bot = Bot(tablebase=tablebase, quiescence=quiescence)
+    _worker_bot.stats.reset()
+    board = ChessBoard.from_fen(fen)
+    board.key_history = list(key_history)  # A FEN has no history, but repetitions of earlier positions are draws
+    _worker_bot.stats.make_moves += 1
+    board.make_move_code(move)
+    score, _ = _worker_bot.minimax(board, depth - 1, board.turn == WHITE, alpha, beta, ply=1)
+    return score, _worker_bot.stats.as_dict()
+
 
 
 def play_vs_bot():
     from rich.prompt import Prompt
     from rich import print
-    import time
 
     board = ChessBoard()
-    bot = Bot()
+    bot = Bot(
+        book=DEFAULT_BOOK if os.path.exists(DEFAULT_BOOK) else None,
+        tablebase=DEFAULT_TABLEBASE if os.path.isdir(DEFAULT_TABLEBASE) else None,  # Built with `python tablebase.py build`
+    )
 
     history = open("./prev.txt", "w")
 
@@ -118,63 +581,144 @@ def play_vs_bot():
                     break
                 else:
                     print("check!!")
+            if board.is_draw_by_rule():
+                print("Draw by repetition or the fifty-move rule")
+                break
 
             board.print_board()
             print()
 
-            global eval_count
-            eval_count = 0
-            start = time.time()
-            val, move = bot.minimax(board, 3, False)
-            end = time.time() - start
+            val, move = bot.search(board, time_limit_ms=3000)
+            stats = bot.stats
 
-            print("Time taken to play: ", end)
-            print("Eval count: ", eval_count)
+            print("Time taken to play: ", stats.seconds, " Depth reached: ", bot.depth_reached)
+            print("Eval count: ", stats.evals)
+            print("Nodes searched: ", stats.nodes, " Quiescence nodes: ", stats.qnodes, " Cutoffs: ", stats.cutoffs)
 
-            board.move_piece(*move, "q")
+            board.make_move(move)  # Also hands the turn back to white
             history.write(
                 ChessBoard.coords_to_file_rank(*move[0])
                 + ChessBoard.coords_to_file_rank(*move[1])
                 + "\n"
             )
 
-            board.turn = WHITE
-
             if board.is_in_check(board.turn):
                 if board.is_checkmate():
                     print(f"{'Black' if board.turn == WHITE else 'White'} wins!")
                     break
                 else:
                     print("check!!")
+            if board.is_draw_by_rule():
+                print("Draw by repetition or the fifty-move rule")
+                break
 
         else:
             print("Invalid move. Try again.")
 
     history.close()
 
-def get_metrics():
-    import time
-
+def get_metrics(workers=None, report=None, profile=False):
+    """
+    Benchmark a depth 4 search on Kiwipete. With workers set, the root moves are split across that many processes.
+    report is a path ('-' for stdout) to write the full statistics to as JSON.
+    """
     board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R")
-    bot = Bot()
+    bot = Bot(profile=profile)
     board.print_board()
     board.move_piece((6, 4), (2, 0))
+    board.turn = BLACK
     board.print_board()
 
-    
-    global eval_count
-    eval_count = 0
-    start = time.time()
-    val, move = bot.minimax(board, 4, False)
-    end = time.time() - start
-
-    board.move_piece(*move, "q")
+    if workers:
+        val, move = bot.parallel_search(board, 4, workers)
+        bot.close()
+    else:
+        stats = bot.stats
+        stats.reset()
+        if profile:
+            stats.start_profile()
+        val, move = bot.minimax(board, 4, False)
+        move = decode_move(move)
+        stats.record_depth(4, val, ChessBoard.move_to_file_rank(move))
+        stats.finish()
+        stats.stop_profile()
+    stats = bot.stats
+
+    board.make_move(move)
     board.print_board()
 
-    print("Time taken to play: ", end)
-    print("Eval count: ", eval_count)
+    print("Time taken to play: ", stats.seconds)
+    print("Eval count: ", stats.evals)
+    print("Nodes searched: ", stats.nodes, " Quiescence nodes: ", stats.qnodes, " Cutoffs: ", stats.cutoffs)
+    print("Table hits: ", bot.tt.hits, "/", bot.tt.probes)
+    if report == "-":
+        print(stats.to_json())
+    elif report:
+        with open(report, "w") as f:
+            f.write(stats.to_json() + "\n")
+
+
+TINY_BUDGET_FEN = "1rb3nr/8/4k2p/pppB1pp1/1PPp1BqP/P2P4/Q3P3/R2KR1N1 b - - 1 33"  # Depth 1 takes well over 100 nodes
+
+
+def check_tiny_budget():
+    """
+    Check search() still returns a legal move when its time or node limit runs out inside the first root move,
+    and NO_MOVE when there is none. Prints each case and returns True if all pass.
+    """
+    board = ChessBoard.from_fen(TINY_BUDGET_FEN)
+    mated = ChessBoard.from_fen("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1")
+    cases = [
+        ("time_limit_ms=1", board, {"time_limit_ms": 1}),
+        ("node_limit=1", board, {"node_limit": 1}),
+        ("node_limit=100", board, {"node_limit": 100}),
+        ("checkmated, node_limit=1", mated, {"node_limit": 1}),
+    ]
+    passed = True
+    for name, position, limits in cases:
+        _, move = Bot().search(position, **limits)
+        legal = position.legal_moves()
+        ok = move in legal if legal else move == NO_MOVE
+        passed = passed and ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {ChessBoard.move_to_file_rank(move) if move != NO_MOVE else 'no move'}")
+    return passed
+
+
+def check_parallel_search(depth=2):
+    """
+    Compare parallel_search with a plain minimax on Kiwipete, including after a search that was stopped or ran
+    out of time and after a change in the number of workers. Prints each case and returns True if all match.
+    """
+    board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    score, move = Bot().minimax(board, depth, True)
+    expected = (score, decode_move(move))
+    bot = Bot()
+    cases = [
+        ("fresh", lambda: None, 2),
+        ("after stop()", bot.stop, 2),
+        ("after a timed out search", lambda: bot.search(board, time_limit_ms=1), 2),
+        ("with more workers", lambda: None, 3),
+    ]
+    passed = True
+    for name, before, workers in cases:
+        before()
+        bot.tt.clear()  # Each case starts from the same table, so the scores can't differ through it
+        result = bot.parallel_search(board, depth, workers)
+        ok = result == expected and bot.pool_workers == workers
+        passed = passed and ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {result[0]} {ChessBoard.move_to_file_rank(result[1])} with {bot.pool_workers} workers")
+    bot.close()
+    return passed
 
-    
 
 if __name__ == "__main__":
-    get_metrics()
+    parser = argparse.ArgumentParser(description="Benchmark the search on Kiwipete")
+    parser.add_argument("workers", nargs="?", type=int, help="split the root moves across this many processes")
+    parser.add_argument("--check", action="store_true", help="check tiny search budgets and parallel_search against minimax instead of benchmarking")
+    parser.add_argument("--json", metavar="PATH", help="write the search statistics as JSON to PATH ('-' for stdout)")
+    parser.add_argument("--profile", action="store_true", help="run the search under cProfile and add the busiest functions to the report")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_tiny_budget() & check_parallel_search() else 1)
+    get_metrics(args.workers, args.json, args.profile)
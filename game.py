@@ -1,53 +1,226 @@
 import copy 
+import random
+from array import array
 # Constants
 WHITE, BLACK = 'white', 'black'  # Defining constants for white and black pieces
 
+# Piece kinds, used to index the piece bitboards. White pieces use bitboards 0-5, black pieces 6-11
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+COLOR_OFFSET = {WHITE: 0, BLACK: 6}
+
+# Step directions for each kind of mover, as (row, col) offsets
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KNIGHT_DIRECTIONS = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
+KING_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+ALL_SQUARES = (1 << 64) - 1
+
+# Lookup tables built once at import, indexed by square (row * 8 + col)
+SQUARE_POS = tuple(divmod(sq, 8) for sq in range(64))  # Square index -> (row, col)
+
+def _leaper_attacks(directions):
+    table = []
+    for x, y in SQUARE_POS:
+        attacks = 0
+        for dx, dy in directions:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                attacks |= 1 << ((x + dx) * 8 + y + dy)
+        table.append(attacks)
+    return table
+
+KNIGHT_ATTACKS = _leaper_attacks(KNIGHT_DIRECTIONS)
+KING_ATTACKS = _leaper_attacks(KING_DIRECTIONS)
+PAWN_ATTACKS = {WHITE: _leaper_attacks([(-1, -1), (-1, 1)]), BLACK: _leaper_attacks([(1, -1), (1, 1)])}  # Squares a pawn captures on
+
+# RAYS[d][sq] lists the squares from sq outwards in direction KING_DIRECTIONS[d] as (pos, bit) pairs, and
+# RAY_MASKS[d][sq] is the same ray as a bitboard. Directions 0-3 are the rook's, 4-7 the bishop's
+RAYS = []
+RAY_MASKS = []
+for _dx, _dy in KING_DIRECTIONS:
+    _rays, _masks = [], []
+    for _x, _y in SQUARE_POS:
+        _ray, _mask = [], 0
+        _nx, _ny = _x + _dx, _y + _dy
+        while 0 <= _nx < 8 and 0 <= _ny < 8:
+            _ray.append(((_nx, _ny), 1 << (_nx * 8 + _ny)))
+            _mask |= 1 << (_nx * 8 + _ny)
+            _nx, _ny = _nx + _dx, _ny + _dy
+        _rays.append(tuple(_ray))
+        _masks.append(_mask)
+    RAYS.append(_rays)
+    RAY_MASKS.append(_masks)
+ROOK_RAYS = [tuple(RAYS[d][sq] for d in range(4)) for sq in range(64)]
+BISHOP_RAYS = [tuple(RAYS[d][sq] for d in range(4, 8)) for sq in range(64)]
+QUEEN_RAYS = [ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64)]
+
+# BETWEEN[a][b] holds the squares strictly between two squares on a shared line, 0 if they aren't aligned
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _d in range(8):
+    for _sq in range(64):
+        _between = 0
+        for _pos, _bit in RAYS[_d][_sq]:
+            BETWEEN[_sq][_pos[0] * 8 + _pos[1]] = _between
+            _between |= _bit
+
+def _ray_attacks(sq, occupied, positive, negative):
+    # Attacks along whole rays up to and including the first blocker. Rays heading to higher squares stop
+    # at their lowest blocker, rays heading to lower squares at their highest one
+    attacks = 0
+    for d in positive:
+        ray = RAY_MASKS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAY_MASKS[d][(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for d in negative:
+        ray = RAY_MASKS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= RAY_MASKS[d][blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rook_attacks(sq, occupied):
+    """Bitboard of squares a rook on sq attacks given the occupied squares."""
+    return _ray_attacks(sq, occupied, (0, 2), (1, 3))
+
+def bishop_attacks(sq, occupied):
+    """Bitboard of squares a bishop on sq attacks given the occupied squares."""
+    return _ray_attacks(sq, occupied, (4, 5), (6, 7))
+
+def use_slider_tables():
+    """
+    Switch rook_attacks/bishop_attacks to full occupancy lookup tables, the same idea as magic bitboards with a
+    dict standing in for the magic multiply. Every blocker pattern that matters on each square is enumerated
+    once. That takes a fraction of a second and around 11 MB, so it is opt-in for long runs.
+    """
+    global rook_attacks, bishop_attacks
+    rook_table, bishop_table = [], []
+    for sq in range(64):
+        for table, directions, slow in ((rook_table, range(4), rook_attacks), (bishop_table, range(4, 8), bishop_attacks)):
+            # The last square of each ray never changes the attacks, so it is left out of the relevant mask
+            mask = 0
+            for d in directions:
+                for pos, bit in RAYS[d][sq][:-1]:
+                    mask |= bit
+            entries = {}
+            subset = 0
+            while True:  # Enumerate every subset of mask (Carry-Rippler)
+                entries[subset] = slow(sq, subset)
+                subset = (subset - mask) & mask
+                if not subset:
+                    break
+            table.append((mask, entries))
+    rook_table, bishop_table = tuple(rook_table), tuple(bishop_table)
+
+    def rook_lookup(sq, occupied):
+        mask, entries = rook_table[sq]
+        return entries[occupied & mask]
+
+    def bishop_lookup(sq, occupied):
+        mask, entries = bishop_table[sq]
+        return entries[occupied & mask]
+
+    rook_attacks, bishop_attacks = rook_lookup, bishop_lookup
+
+# Zobrist keys: one random 64-bit number per (piece, square), castling right, en passant file and for black
+# to move. A position's key is the XOR of the numbers for everything in it. The seed is fixed so keys are
+# the same in every process and can be stored on disk
+_zobrist_random = random.Random(20240611)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(4)]  # White kingside, white queenside, black kingside, black queenside
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+
+# Rook starting squares and the castling right each one guards
+CASTLING_CORNERS = {
+    (7, 7): (WHITE, 'kingside'), (7, 0): (WHITE, 'queenside'),
+    (0, 7): (BLACK, 'kingside'), (0, 0): (BLACK, 'queenside'),
+}
+
+# Squares are numbered row * 8 + col, so bit 0 is A8 and bit 63 is H1 (same orientation as ChessBoard.board)
+def square_index(pos):
+    return pos[0] * 8 + pos[1]
+
+def iter_squares(bb):
+    """Yield the index of every set bit in a bitboard, lowest first."""
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+def piece_square_value(piece, x, y):
+    """Value of a piece plus its square bonus, positive for white and negative for black."""
+    return piece.square_values[piece.color][x * 8 + y]
+
 # Chess Pieces Classes
 class Piece:
-    def __init__(self, color):
-        self.value = None
-        self.bonus = [
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0, 0, 0, 0]
-        ]
-
+    __slots__ = ('color', 'has_moved')  # Pieces are copied for every clone, so they carry no per-instance tables
+    kind = None  # Index of the piece type in the board's bitboards, set by each subclass
+    value = None
+    bonus = [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ]
 
+    def __init__(self, color):
         self.color = color  # Every piece has a color (white or black)
         self.has_moved = False  # Tracks whether the piece has moved (important for castling)
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Flatten each class's bonus table once, indexed by square (row * 8 + col). Black's copy is already
+        # mirrored top to bottom, and square_values folds in the piece value with black counted negative
+        flat = [bonus for row in cls.bonus for bonus in row]
+        mirrored = [bonus for row in cls.bonus[::-1] for bonus in row]
+        cls.pst = {WHITE: flat, BLACK: mirrored}
+        cls.square_values = {WHITE: [cls.value + bonus for bonus in flat], BLACK: [-(cls.value + bonus) for bonus in mirrored]}
+
     def valid_moves(self, pos):
         pass  # This is a placeholder method to be implemented by specific piece types
 
     def filter_moves(self, board, pos, moves):
         """Filter out moves that would leave the king in check."""
-        valid_moves = []
-        for move in moves:
-            if not board.move_leaves_king_in_check(pos, move):
-                valid_moves.append(move)
-        return valid_moves
+        legal = {move[1] for move in board.legal_moves(self.color) if move[0] == pos}
+        return [move for move in moves if move in legal]
+
+    # Helper method for sliding pieces (rook, bishop and queen)
+    def _generate_sliding_moves(self, board, rays):
+        moves = []  # List to store valid moves
+        occupied = board.occupied
+        own = board.occupancy[self.color]
+        for ray in rays:  # Each precomputed ray lists the squares outwards from the piece, so no bounds checks are needed
+            for target, bit in ray:
+                if occupied & bit:
+                    if not own & bit:  # If it's an opponent's piece, capture and stop moving further
+                        moves.append(target)
+                    break  # Stop at the first piece either way
+                moves.append(target)  # Empty square
+        return moves  # Return the list of valid moves
 
     def __repr__(self):
         return "theres an error somewhere"
 
 # Class for Pawn Piece
 class Pawn(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.value = 100
-        self.bonus = [[0, 0, 0, 0, 0, 0, 0, 0],
-                      [50, 50, 50, 50, 50, 50, 50, 50],
-                      [10, 10, 20, 30, 30, 20, 10, 10],
-                      [5, 5, 10, 25, 25, 10, 5, 5],
-                      [0, 0, 0, 20, 20, 0, 0, 0],
-                      [5, -5, -10, 0, 0, -10, -5, 5],
-                      [5, 10, 10, -20, -20, 10, 10, 5],
-                      [0, 0, 0, 0, 0, 0, 0, 0]]
+    __slots__ = ()
+    kind = PAWN
+    value = 100
+    bonus = [[0, 0, 0, 0, 0, 0, 0, 0],
+             [50, 50, 50, 50, 50, 50, 50, 50],
+             [10, 10, 20, 30, 30, 20, 10, 10],
+             [5, 5, 10, 25, 25, 10, 5, 5],
+             [0, 0, 0, 20, 20, 0, 0, 0],
+             [5, -5, -10, 0, 0, -10, -5, 5],
+             [5, 10, 10, -20, -20, 10, 10, 5],
+             [0, 0, 0, 0, 0, 0, 0, 0]]
 
     def valid_moves(self, board, pos, en_passant_target=None):
         moves = []  # List to store valid moves for the pawn
@@ -57,20 +230,17 @@ class Pawn(Piece):
         # Move forward by one square
         if 0 <= x + direction and x + direction < 8 and board.get_piece((x + direction, y)) == ' ':
             moves.append((x + direction, y))  # Add the forward move
-            # Two-square move from starting position
-            if not self.has_moved and 0 <= x + 2 * direction and x + 2 * direction < 8 and board.get_piece((x + 2 * direction, y)) == ' ':
+            # Two-square move from starting position (checked by row, since pieces set up from FEN haven't "moved")
+            if x == (6 if self.color == WHITE else 1) and board.get_piece((x + 2 * direction, y)) == ' ':
                 moves.append((x + 2 * direction, y))  # Add the two-square move
 
-        # Diagonal captures
-        for dy in [-1, 1]:  # Check both diagonal directions (left and right)
-            if 0 <= y + dy < 8:  # Ensure it's within board limits
-                if x + direction >= 0 and x + direction < 8:
-                    target = board.get_piece((x + direction, y + dy))  # Get the piece diagonally
-                    if target != " " and target.color != self.color:  # If there's an enemy piece, capture
-                        moves.append((x + direction, y + dy))
-                     # En Passant capture
-                    if en_passant_target == (x + direction, y + dy):  # Special rule: capture via en passant
-                        moves.append((x + direction, y + dy))
+        # Diagonal captures onto enemy pieces
+        attacks = PAWN_ATTACKS[self.color][x * 8 + y]
+        for sq in iter_squares(attacks & board.occupancy[BLACK if self.color == WHITE else WHITE]):
+            moves.append(SQUARE_POS[sq])
+        # En Passant capture
+        if en_passant_target is not None and attacks >> (en_passant_target[0] * 8 + en_passant_target[1]) & 1:
+            moves.append(en_passant_target)
         return moves  # Return the list of valid moves
 
 
@@ -95,176 +265,114 @@ class Pawn(Piece):
 
 # Class for Rook Piece
 class Rook(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.value = 500
-        self.bonus = [
-            [0,  0,  0,  5,  5,  0,  0,  0],
-            [-5,  0,  0,  0,  0,  0,  0, -5],
-            [-5,  0,  0,  0,  0,  0,  0, -5],
-            [-5,  0,  0,  0,  0,  0,  0, -5],
-            [-5,  0,  0,  0,  0,  0,  0, -5],
-            [-5,  0,  0,  0,  0,  0,  0, -5],
-            [5, 10, 10, 10, 10, 10, 10,  5],
-            [0,  0,  0,  0,  0,  0,  0, 0]]
+    __slots__ = ()
+    kind = ROOK
+    value = 500
+    bonus = [
+        [0,  0,  0,  5,  5,  0,  0,  0],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [-5,  0,  0,  0,  0,  0,  0, -5],
+        [5, 10, 10, 10, 10, 10, 10,  5],
+        [0,  0,  0,  0,  0,  0,  0, 0]]
 
     def valid_moves(self, board, pos, en_passant_target=None):
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]  # Rook can move in four directions (up, down, left, right)
-        moves = self._generate_sliding_moves(board, pos, directions)
+        moves = self._generate_sliding_moves(board, ROOK_RAYS[pos[0] * 8 + pos[1]])  # Rook can move in four directions (up, down, left, right)
         return  moves # Generate all valid moves for rook
 
-    # Helper method for sliding pieces (rook and bishop)
-    def _generate_sliding_moves(self, board, pos, directions):
-        moves = []  # List to store valid moves
-        x, y = pos  # Current position of the rook
-        for dx, dy in directions:  # Iterate over each direction
-            nx, ny = x + dx, y + dy  # Move in the direction
-            while 0 <= nx < 8 and 0 <= ny < 8:  # While the new position is within the board
-                target = board.get_piece((nx, ny))  # Get the piece at the new position
-                if target == ' ':  # If the square is empty, add it as a valid move
-                    moves.append((nx, ny))
-                elif target.color != self.color:  # If it's an opponent's piece, capture and stop moving further
-                    moves.append((nx, ny))
-                    break
-                else:
-                    break  # Stop moving if it's our own piece
-                nx, ny = nx + dx, ny + dy  # Move further in the same direction
-        
-        return moves  # Return the list of valid moves
-    
     def __repr__(self):
         return '♜' if self.color == WHITE else '♖'
 
 # Class for Knight Piece
 class Knight(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.value = 320
-        self.bonus = [[-50, -40, -30, -30, -30, -30, -40, -50],
-                      [-40, -20, 0, 0, 0, 0, -20, -40],
-                      [-30, 0, 10, 15, 15, 10, 0, -30],
-                      [-30, 5, 15, 20, 20, 15, 5, -30],
-                      [-30, 0, 15, 20, 20, 15, 0, -30],
-                      [-30, 5, 10, 15, 15, 10, 5, -30],
-                      [-40, -20, 0, 5, 5, 0, -20, -40],
-                      [-50, -40, -30, -30, -30, -30, -40, -50]]
+    __slots__ = ()
+    kind = KNIGHT
+    value = 320
+    bonus = [[-50, -40, -30, -30, -30, -30, -40, -50],
+             [-40, -20, 0, 0, 0, 0, -20, -40],
+             [-30, 0, 10, 15, 15, 10, 0, -30],
+             [-30, 5, 15, 20, 20, 15, 5, -30],
+             [-30, 0, 15, 20, 20, 15, 0, -30],
+             [-30, 5, 10, 15, 15, 10, 5, -30],
+             [-40, -20, 0, 5, 5, 0, -20, -40],
+             [-50, -40, -30, -30, -30, -30, -40, -50]]
 
     def valid_moves(self, board, pos, en_passant_target=None):
-
-        directions = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]  # Knight's L-shaped moves
-        x, y = pos  # Current position of the knight
-        valid_moves = []  # List to store valid moves
-        for dx, dy in directions:  # Iterate over each possible L-shaped move
-            nx, ny = x + dx, y + dy  # Calculate the new position
-            if 0 <= nx < 8 and 0 <= ny < 8:  # Ensure the new position is within the board
-                target = board.get_piece((nx, ny))  # Get the piece at the new position
-                if target == " " or target.color != self.color:  # Move if it's empty or an opponent's piece
-
-                    valid_moves.append((nx, ny))
-        return valid_moves  # Return the list of valid moves
+        # Knight's L-shaped moves come from the attack table, minus squares held by our own pieces
+        targets = KNIGHT_ATTACKS[pos[0] * 8 + pos[1]] & ~board.occupancy[self.color]
+        return [SQUARE_POS[sq] for sq in iter_squares(targets)]  # Return the list of valid moves
     
     def __repr__(self):
         return '♞' if self.color == WHITE else '♘'
 
 # Class for Bishop Piece
 class Bishop(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.value = 330
-        self.bonus = [
-            [-20, -10, -10, -10, -10, -10, -10, -20],
-            [-10, 0, 0, 0, 0, 0, 0, -10],
-            [-10, 0, 5, 10, 10, 5, 0, -10],
-            [-10, 5, 5, 10, 10, 5, 5, -10],
-            [-10, 0, 10, 10, 10, 10, 0, -10],
-            [-10, 10, 10, 10, 10, 10, 10, -10],
-            [-10, 5, 0, 0, 0, 0, 5, -10],
-            [-20, -10, -10, -10, -10, -10, -10, -20]
+    __slots__ = ()
+    kind = BISHOP
+    value = 330
+    bonus = [
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 10, 10, 5, 0, -10],
+        [-10, 5, 5, 10, 10, 5, 5, -10],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-10, 10, 10, 10, 10, 10, 10, -10],
+        [-10, 5, 0, 0, 0, 0, 5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20]
     ]
 
     def valid_moves(self, board, pos, en_passant_target=None):
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]  # Bishop moves diagonally in four directions
-        moves = self._generate_sliding_moves(board, pos, directions)
+        moves = self._generate_sliding_moves(board, BISHOP_RAYS[pos[0] * 8 + pos[1]])  # Bishop moves diagonally in four directions
         return  moves # Generate all valid moves for bishop
 
-    # Helper method for sliding pieces (same as in Rook)
-    def _generate_sliding_moves(self, board, pos, directions):
-        moves = []  # List to store valid moves
-        x, y = pos  # Current position of the bishop
-        for dx, dy in directions:  # Iterate over each diagonal direction
-            nx, ny = x + dx, y + dy  # Move in the direction
-            while 0 <= nx < 8 and 0 <= ny < 8:  # While the new position is within the board
-                target = board.get_piece((nx, ny))  # Get the piece at the new position
-                if target == ' ':  # If the square is empty, add it as a valid move
-                    moves.append((nx, ny))
-                elif target.color != self.color:  # If it's an opponent's piece, capture and stop moving further
-                    moves.append((nx, ny))
-                    break
-                else:
-                    break  # Stop moving if it's our own piece
-                nx, ny = nx + dx, ny + dy  # Move further in the same direction
-        return moves  # Return the list of valid moves
-    
     def __repr__(self):
         return '♝' if self.color == WHITE else '♗'
 
 # Class for Queen Piece
 class Queen(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.value = 900
-        self.bonus = [
-                      [-20, -10, -10, -5, -5, -10, -10, -20],
-                      [-10, 0, 0, 0, 0, 0, 0, -10],
-                      [-10, 0, 5, 5, 5, 5, 0, -10],
-                      [-5, 0, 5, 5, 5, 5, 0, -5],
-                      [0, 0, 5, 5, 5, 5, 0, -5],
-                      [-10, 5, 5, 5, 5, 5, 0, -10],
-                      [-10, 0, 5, 0, 0, 0, 0, -10],
-                      [-20, -10, -10, -5, -5, -10, -10, -20]
-            ]
+    __slots__ = ()
+    kind = QUEEN
+    value = 900
+    bonus = [
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 5, 5, 5, 0, -10],
+        [-5, 0, 5, 5, 5, 5, 0, -5],
+        [0, 0, 5, 5, 5, 5, 0, -5],
+        [-10, 5, 5, 5, 5, 5, 0, -10],
+        [-10, 0, 5, 0, 0, 0, 0, -10],
+        [-20, -10, -10, -5, -5, -10, -10, -20]
+    ]
+
     def valid_moves(self, board, pos, en_passant_target=None):
-        # Combine Rook and Bishop movement logic since Queen moves like both
-        return Rook(self.color).valid_moves(board, pos) + Bishop(self.color).valid_moves(board, pos)
+        # Queen moves like a rook and a bishop combined
+        return self._generate_sliding_moves(board, QUEEN_RAYS[pos[0] * 8 + pos[1]])
     
     def __repr__(self):
         return '♛' if self.color == WHITE else '♕'
 
 # Class for King Piece
 class King(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.value = 20000
-        self.bonus = [[-30, -40, -40, -50, -50, -40, -40, -30],
-                      [-30, -40, -40, -50, -50, -40, -40, -30],
-                      [-30, -40, -40, -50, -50, -40, -40, -30],
-                      [-30, -40, -40, -50, -50, -40, -40, -30],
-                      [-20, -30, -30, -40, -40, -30, -30, -20],
-                      [-10, -20, -20, -20, -20, -20, -20, -10],
-                      [20, 20, 0, 0, 0, 0, 20, 20],
-                      [20, 30, 10, 0, 0, 10, 30, 20]]
+    __slots__ = ()
+    kind = KING
+    value = 20000
+    bonus = [[-30, -40, -40, -50, -50, -40, -40, -30],
+             [-30, -40, -40, -50, -50, -40, -40, -30],
+             [-30, -40, -40, -50, -50, -40, -40, -30],
+             [-30, -40, -40, -50, -50, -40, -40, -30],
+             [-20, -30, -30, -40, -40, -30, -30, -20],
+             [-10, -20, -20, -20, -20, -20, -20, -10],
+             [20, 20, 0, 0, 0, 0, 20, 20],
+             [20, 30, 10, 0, 0, 10, 30, 20]]
 
     def valid_moves(self, board, pos, en_passant_target=None):
-        directions = [
-            (1, 0), (-1, 0), (0, 1), (0, -1),  # King's movement: one square in any horizontal or vertical direction
-            (1, 1), (1, -1), (-1, 1), (-1, -1)  # Also one square diagonally
-        ]
-        moves = []  # List to store valid moves
         x, y = pos  # Current position of the king
-         # Initialize a cache to avoid recursion
-        if 'visited_positions' not in board.__dict__:
-            board.visited_positions = set()
-        if pos in board.visited_positions:
-            return []  # Avoid recalculating moves for the same position within the same call stack.
-        board.visited_positions.add(pos)
-        for dx, dy in directions:  # Iterate over each direction
-            nx, ny = x + dx, y + dy  # Calculate the new position
-            if 0 <= nx < 8 and 0 <= ny < 8:  # Ensure the new position is within the board
-                target = board.get_piece((nx, ny))  # Get the piece at the new position
-                if target == ' ' or target.color != self.color:  # Move if it's empty or an opponent's piece
-                    moves.append((nx, ny))
+        # One square in any direction, onto an empty square or an opponent's piece
+        moves = [SQUARE_POS[sq] for sq in iter_squares(KING_ATTACKS[x * 8 + y] & ~board.occupancy[self.color])]
         
-        if not self.has_moved:
+        if not self.has_moved and y == 4:
             # Castling moves
             if board.castling_rights[self.color]['kingside']:
                 if self._can_castle_kingside(board, pos):
@@ -273,126 +381,400 @@ class King(Piece):
                 if self._can_castle_queenside(board, pos):
                     moves.append((x, y - 2))   
 
-        # Reset the cache after calculation
-        board.visited_positions.remove(pos)
-                
         return moves  # Return the list of valid moves
 
     def _can_castle_kingside(self, board, pos):
         x, y = pos
-        # Ensure the squares between king and rook are empty and not under attack
+        rook = board.get_piece((x, 7))
+        # Ensure the squares between king and rook are empty, and the king doesn't start on, pass or land on an attacked square
         return (
             board.get_piece((x, y + 1)) == ' ' and
             board.get_piece((x, y + 2)) == ' ' and
-            not board.is_in_check(self.color) and
-            not board.is_under_attack((x, y + 1), self.color) and
-            not board.is_under_attack((x, y + 2), self.color) and
-            isinstance(board.get_piece((x, 7)), Rook) and
-            not board.get_piece((x, 7)).has_moved
+            isinstance(rook, Rook) and rook.color == self.color and
+            not rook.has_moved and
+            not board.attack_map(BLACK if self.color == WHITE else WHITE) & (0b111 << (x * 8 + y))
         )
 
     def _can_castle_queenside(self, board, pos):
         x, y = pos
-        # Ensure the squares between king and rook are empty and not under attack
+        rook = board.get_piece((x, 0))
+        # Ensure the squares between king and rook are empty, and the king doesn't start on, pass or land on an attacked square
         return (
             board.get_piece((x, y - 1)) == ' ' and
             board.get_piece((x, y - 2)) == ' ' and
             board.get_piece((x, y - 3)) == ' ' and
-            not board.is_in_check(self.color) and
-            not board.is_under_attack((x, y - 1), self.color) and
-            not board.is_under_attack((x, y - 2), self.color) and
-            isinstance(board.get_piece((x, 0)), Rook) and
-            not board.get_piece((x, 0)).has_moved
+            isinstance(rook, Rook) and rook.color == self.color and
+            not rook.has_moved and
+            not board.attack_map(BLACK if self.color == WHITE else WHITE) & (0b111 << (x * 8 + y - 2))
         )
     
     def __repr__(self):
         return '♚' if self.color == WHITE else '♔'
 
+PIECE_VALUES = [Pawn.value, Knight.value, Bishop.value, Rook.value, Queen.value, King.value]  # Indexed by kind
+
+# FEN character tables
+FEN_PIECES = {
+    'P': (Pawn, WHITE), 'N': (Knight, WHITE), 'B': (Bishop, WHITE), 'R': (Rook, WHITE), 'Q': (Queen, WHITE), 'K': (King, WHITE),
+    'p': (Pawn, BLACK), 'n': (Knight, BLACK), 'b': (Bishop, BLACK), 'r': (Rook, BLACK), 'q': (Queen, BLACK), 'k': (King, BLACK),
+}
+FEN_SYMBOLS = [None] * 12  # Bitboard index (kind + color offset) -> FEN character
+for _symbol, (_piece_class, _color) in FEN_PIECES.items():
+    FEN_SYMBOLS[_piece_class.kind + COLOR_OFFSET[_color]] = _symbol
+FEN_EMPTY_RUNS = {str(n): n for n in range(1, 9)}
+FEN_DIGITS = [None] + [str(n) for n in range(1, 9)]
+FEN_CASTLING_SQUARES = {'K': ((7, 7), (7, 4)), 'Q': ((7, 0), (7, 4)), 'k': ((0, 7), (0, 4)), 'q': ((0, 0), (0, 4))}  # Rook and king home squares
+
+# Moves packed into 16 bits: start square in bits 0-5, end square in bits 6-11, promotion piece in bits 12-13
+# and a flag in bits 14-15. No move goes from a8 to a8, so 0 stands for none
+MOVE_NONE = 0
+PROMOTION_FLAG, EN_PASSANT_FLAG, CASTLING_FLAG = 1 << 14, 2 << 14, 3 << 14
+FLAG_MASK = 3 << 14
+PROMOTION_PIECES = "qrbn"  # Promotion choice by its code in bits 12-13
+PROMOTION_MOVE_CODES = {choice: PROMOTION_FLAG | code << 12 for code, choice in enumerate(PROMOTION_PIECES)}
+MAX_MOVES = 256  # More than any position has legal moves (the most known is 218)
+
+
+def new_move_buffer():
+    """An array('H') with room for every move of a position, for generate_moves to fill again and again."""
+    return array('H', bytes(2 * MAX_MOVES))
+
+
+def decode_move(code):
+    """Turn an encoded move back into ((row, col), (row, col)), or ((row, col), (row, col), choice) for a promotion."""
+    if code & FLAG_MASK == PROMOTION_FLAG:
+        return SQUARE_POS[code & 63], SQUARE_POS[code >> 6 & 63], PROMOTION_PIECES[code >> 12 & 3]
+    return SQUARE_POS[code & 63], SQUARE_POS[code >> 6 & 63]
+
+
+def move_code_to_file_rank(code):
+    """Write an encoded move the way play_vs_bot logs it, e.g. E2E4 or A7A8q."""
+    return ChessBoard.move_to_file_rank(decode_move(code))
+
 # Chess Board Setup
 class ChessBoard:
     def __init__(self):
         self.board = self.initialize_board()
+        self._turn = WHITE
+        self.zobrist_key = 0  # Hash of the position, kept up to date by every move (see compute_zobrist)
         self.turn = WHITE #game starts with the player controlling the white pieces
         self.en_passant_target = None #track the target square for an en passant capture
         self.castling_rights = {
             WHITE: {'kingside': True, 'queenside': True},
             BLACK: {'kingside': True, 'queenside': True}
         } #Both players start with the ability to castle on both the kingside and queenside.
+        self.halfmove_clock = 0  # Moves since the last capture or pawn move, for the fifty-move rule
+        self.fullmove_number = 1  # Starts at 1 and goes up after each black move
+        self.key_history = []  # Zobrist keys of the positions before each move played, oldest first
+        self.rebuild_bitboards()
 
 
     def clone(self):
-        ret = ChessBoard()
-        ret.board = copy.deepcopy(self.board)
-        ret.turn = self.turn
+        ret = ChessBoard.__new__(ChessBoard)  # Skip __init__, which would build a throwaway starting position
+        ret.board = [[copy.copy(piece) for piece in row] for row in self.board]
+        ret._turn = self.turn
+        ret.zobrist_key = self.zobrist_key
+        ret.psq_score = self.psq_score
         ret.en_passant_target = self.en_passant_target
         ret.castling_rights = copy.deepcopy(self.castling_rights)
+        ret.halfmove_clock = self.halfmove_clock
+        ret.fullmove_number = self.fullmove_number
+        ret.key_history = self.key_history[:]
+        ret.bitboards = self.bitboards[:]
+        ret.occupancy = dict(self.occupancy)
+        ret.occupied = self.occupied
+        ret._attack_maps = self._attack_maps
 
         return ret
 
+    def rebuild_bitboards(self):
+        """Recompute the piece bitboards and occupancy masks from self.board."""
+        self.bitboards = [0] * 12  # One bitboard per piece kind and color
+        self.occupancy = {WHITE: 0, BLACK: 0}  # All squares occupied by each side
+        self.occupied = 0  # All occupied squares
+        for x in range(8):
+            for y in range(8):
+                piece = self.board[x][y]
+                if piece != ' ':
+                    bit = 1 << (x * 8 + y)
+                    self.bitboards[piece.kind + COLOR_OFFSET[piece.color]] |= bit
+                    self.occupancy[piece.color] |= bit
+                    self.occupied |= bit
+        self._attack_maps = None  # Squares attacked by each side, filled in lazily by attack_map
+        self.zobrist_key = self.compute_zobrist()
+        self.psq_score = self.compute_psq_score()
+
+    @property
+    def turn(self):
+        return self._turn
+
+    @turn.setter
+    def turn(self, color):
+        # The side to move is part of the position key, so switching it has to update the key
+        if color != self._turn:
+            self.zobrist_key ^= ZOBRIST_BLACK_TO_MOVE
+        self._turn = color
+
+    def compute_zobrist(self):
+        """Compute the Zobrist key of the position from scratch. Moves keep self.zobrist_key updated incrementally."""
+        key = ZOBRIST_BLACK_TO_MOVE if self.turn == BLACK else 0
+        for kind, bb in enumerate(self.bitboards):
+            for sq in iter_squares(bb):
+                key ^= ZOBRIST_PIECES[kind][sq]
+        return key ^ self._state_key(self._castling_state(), self.en_passant_target)
+
+    def compute_psq_score(self):
+        """Material plus piece-square score from white's point of view, from scratch. Moves keep self.psq_score updated."""
+        score = 0
+        for (x, y), piece in self.pieces():
+            score += piece_square_value(piece, x, y)
+        return score
+
+    def _castling_state(self):
+        rights = self.castling_rights
+        return (rights[WHITE]['kingside'], rights[WHITE]['queenside'], rights[BLACK]['kingside'], rights[BLACK]['queenside'])
+
+    @staticmethod
+    def _state_key(castling, en_passant_target):
+        # Part of the Zobrist key covering castling rights and the en passant file
+        key = 0
+        for allowed, castling_key in zip(castling, ZOBRIST_CASTLING):
+            if allowed:
+                key ^= castling_key
+        if en_passant_target is not None:
+            key ^= ZOBRIST_EN_PASSANT[en_passant_target[1]]
+        return key
+
+    def put_piece(self, pos, piece):
+        """Place a piece on an empty square, keeping the bitboards in sync."""
+        x, y = pos
+        self.board[x][y] = piece
+        sq = x * 8 + y
+        bit = 1 << sq
+        index = piece.kind + COLOR_OFFSET[piece.color]
+        self.bitboards[index] |= bit
+        self.occupancy[piece.color] |= bit
+        self.occupied |= bit
+        self.zobrist_key ^= ZOBRIST_PIECES[index][sq]
+        self.psq_score += piece_square_value(piece, x, y)
+        self._attack_maps = None
+
+    def remove_piece(self, pos):
+        """Empty a square and return whatever was on it."""
+        x, y = pos
+        piece = self.board[x][y]
+        if piece == ' ':
+            return piece
+        self.board[x][y] = ' '
+        sq = x * 8 + y
+        mask = ~(1 << sq)
+        index = piece.kind + COLOR_OFFSET[piece.color]
+        self.bitboards[index] &= mask
+        self.occupancy[piece.color] &= mask
+        self.occupied &= mask
+        self.zobrist_key ^= ZOBRIST_PIECES[index][sq]
+        self.psq_score -= piece_square_value(piece, x, y)
+        self._attack_maps = None
+        return piece
+
+    def pieces(self, color=None):
+        """Yield (pos, piece) for every piece of the given color, or all pieces if color is None."""
+        bb = self.occupied if color is None else self.occupancy[color]
+        for sq in iter_squares(bb):
+            x, y = divmod(sq, 8)
+            yield (x, y), self.board[x][y]
+
+    def attacks_to(self, pos, by_color):
+        """
+        Return a bitboard of the by_color pieces attacking pos. Works outwards from pos with the attack tables,
+        so it only looks at the squares an attacker could stand on instead of generating the attackers' moves.
+        """
+        sq = pos[0] * 8 + pos[1]
+        off = COLOR_OFFSET[by_color]
+        bitboards = self.bitboards
+
+        # A leaper attacks pos exactly when pos could leap back onto it. Pawns are the exception, they are
+        # found from the squares a pawn of the other color on pos would capture on
+        attackers = (
+            KNIGHT_ATTACKS[sq] & bitboards[KNIGHT + off]
+            | KING_ATTACKS[sq] & bitboards[KING + off]
+            | PAWN_ATTACKS[BLACK if by_color == WHITE else WHITE][sq] & bitboards[PAWN + off]
+        )
+
+        # Sliders, found by casting rays from pos to the first occupied square in each direction
+        queens = bitboards[QUEEN + off]
+        sliders = bitboards[ROOK + off] | queens
+        if sliders:
+            attackers |= rook_attacks(sq, self.occupied) & sliders
+        sliders = bitboards[BISHOP + off] | queens
+        if sliders:
+            attackers |= bishop_attacks(sq, self.occupied) & sliders
+        return attackers
+
+    def attacks_from(self, pos):
+        """Return a bitboard of the squares attacked by the piece on pos, including squares held by its own side."""
+        piece = self.board[pos[0]][pos[1]]
+        if piece == ' ':
+            return 0
+        sq = pos[0] * 8 + pos[1]
+        kind = piece.kind
+        if kind == PAWN:
+            return PAWN_ATTACKS[piece.color][sq]
+        if kind == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if kind == KING:
+            return KING_ATTACKS[sq]
+        if kind == ROOK:
+            return rook_attacks(sq, self.occupied)
+        if kind == BISHOP:
+            return bishop_attacks(sq, self.occupied)
+        return rook_attacks(sq, self.occupied) | bishop_attacks(sq, self.occupied)
+
+    def attack_map(self, color):
+        """
+        Return a bitboard of every square attacked by color. The maps are cached on the board and dropped
+        whenever a piece is placed or removed, so repeated queries on one position are free.
+        """
+        if self._attack_maps is None:
+            self._attack_maps = {}
+        elif color in self._attack_maps:
+            return self._attack_maps[color]
+        attacked = 0
+        for sq in iter_squares(self.occupancy[color]):
+            attacked |= self.attacks_from(divmod(sq, 8))
+        self._attack_maps[color] = attacked
+        return attacked
+
+
+    def static_exchange(self, start, end):
+        """
+        Return the material the piece on start wins by capturing on end, if both sides then keep recapturing
+        on end with their least valuable attacker for as long as it pays. Pieces behind the capturers join in
+        as the squares in front of them empty. Promotions are not counted.
+        """
+        piece = self.board[start[0]][start[1]]
+        target = self.board[end[0]][end[1]]
+        if target != ' ':
+            gains = [target.value]
+        elif piece.kind == PAWN and end == self.en_passant_target and end[1] != start[1]:
+            gains = [Pawn.value]
+        else:
+            gains = [0]
+
+        saved_occupied = self.occupied
+        self.occupied ^= 1 << (start[0] * 8 + start[1])
+        attacker_value = piece.value
+        side = BLACK if piece.color == WHITE else WHITE
+        while True:
+            # What the side about to recapture would win, if the last capturer is taken
+            gains.append(attacker_value - gains[-1])
+            if max(-gains[-2], gains[-1]) < 0:  # Neither side can come out ahead by going on
+                break
+            attackers = self.attacks_to(end, side) & self.occupied
+            if not attackers:
+                break
+            off = COLOR_OFFSET[side]
+            for kind in range(PAWN, KING + 1):
+                candidates = attackers & self.bitboards[kind + off]
+                if candidates:
+                    break
+            self.occupied ^= candidates & -candidates
+            attacker_value = PIECE_VALUES[kind]
+            side = BLACK if side == WHITE else WHITE
+        self.occupied = saved_occupied
+
+        # Either side can stop recapturing, so work back from the end keeping whichever is better for the side to move
+        for i in range(len(gains) - 2, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
 
     @classmethod
     def from_fen(cls, fen_str):
-        new = cls()
-        new.board = [
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-            [' ', ' ', ' ', ' ', ' ', ' ', ' ', ' '],
-        ]
-        ranks = fen_str.split("/")
+        """
+        Build a board from a FEN string. Only the placement field is required. Missing fields default to white
+        to move, castling rights for every king and rook still on its home square, no en passant square and
+        clocks of 0 and 1. Raises ValueError for malformed input.
+        """
+        fields = fen_str.split()
+        if not fields or len(fields) > 6:
+            raise ValueError(f"FEN needs 1 to 6 fields: {fen_str!r}")
+
+        # Set up the board directly instead of going through __init__, which would build the starting position
+        new = cls.__new__(cls)
+        new.board = [[' '] * 8 for _ in range(8)]
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError(f"FEN placement needs 8 ranks: {fields[0]!r}")
         for i, rank in enumerate(ranks):
             file = 0
-            for piece in rank:
-                match piece.lower():
-                    case 'p':
-                        new.board[i][file] = Pawn(WHITE if piece.isupper() else BLACK)
-                    case 'n':
-                        new.board[i][file] = Knight(WHITE if piece.isupper() else BLACK)
-                    case 'b':
-                        new.board[i][file] = Bishop(WHITE if piece.isupper() else BLACK)
-                    case 'r':
-                        new.board[i][file] = Rook(WHITE if piece.isupper() else BLACK)
-                    case 'q':
-                        new.board[i][file] = Queen(WHITE if piece.isupper() else BLACK)
-                    case 'k':
-                        new.board[i][file] = King(WHITE if piece.isupper() else BLACK)
-                    case n if n.isnumeric():
-                        file += int(n) - 1
-                file += 1
-
+            for char in rank:
+                if char in FEN_EMPTY_RUNS:
+                    file += FEN_EMPTY_RUNS[char]
+                elif char in FEN_PIECES and file < 8:
+                    piece_class, color = FEN_PIECES[char]
+                    new.board[i][file] = piece_class(color)
+                    file += 1
+                else:
+                    raise ValueError(f"Bad FEN rank {rank!r}")
+            if file != 8:
+                raise ValueError(f"FEN rank {rank!r} doesn't cover 8 squares")
+
+        side = fields[1] if len(fields) > 1 else 'w'
+        if side not in ('w', 'b'):
+            raise ValueError(f"Bad side to move {side!r}")
+        new._turn = WHITE if side == 'w' else BLACK
+
+        if len(fields) > 2:
+            castling = fields[2]
+            if castling != '-' and (not castling or any(char not in "KQkq" for char in castling)):
+                raise ValueError(f"Bad castling field {castling!r}")
+        else:
+            castling = ''.join(symbol for symbol, (corner, home) in FEN_CASTLING_SQUARES.items()
+                               if isinstance(new.board[corner[0]][corner[1]], Rook) and new.board[corner[0]][corner[1]].color == FEN_PIECES[symbol][1]
+                               and isinstance(new.board[home[0]][home[1]], King) and new.board[home[0]][home[1]].color == FEN_PIECES[symbol][1])
+        new.castling_rights = {
+            WHITE: {'kingside': 'K' in castling, 'queenside': 'Q' in castling},
+            BLACK: {'kingside': 'k' in castling, 'queenside': 'q' in castling}
+        }
+
+        new.en_passant_target = None
+        if len(fields) > 3 and fields[3] != '-':
+            square = fields[3]
+            if len(square) != 2 or square[0] not in "abcdefgh" or square[1] not in "36":
+                raise ValueError(f"Bad en passant square {square!r}")
+            new.en_passant_target = cls.file_rank_to_coords(square[0].upper(), square[1])
+
+        try:
+            new.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            new.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Bad move clocks in {fen_str!r}") from None
+        new.key_history = []
+
+        new.rebuild_bitboards()
         return new
 
     def get_fen(self):
-        fen_str = ""
-        for rank in self.board:
+        """Write the position as a six-field FEN string. from_fen(board.get_fen()) rebuilds the same position."""
+        ranks = []
+        for row in self.board:
+            rank = []
             space_count = 0
-            for file in rank:
-                if file != ' ' and space_count > 0:
-                    fen_str += str(space_count)
+            for piece in row:
+                if piece == ' ':
+                    space_count += 1
+                    continue
+                if space_count:
+                    rank.append(FEN_DIGITS[space_count])
                     space_count = 0
-                    
-                match file:
-                    case file if isinstance(file, Pawn):
-                        fen_str += "p" if file.color == BLACK else "P"
-                    case file if isinstance(file, Rook):
-                        fen_str += "r" if file.color == BLACK else "R"
-                    case file if isinstance(file, Knight):
-                        fen_str += "n" if file.color == BLACK else "N"
-                    case file if isinstance(file, Bishop):
-                        fen_str += "b" if file.color == BLACK else "B"
-                    case file if isinstance(file, King):
-                        fen_str += "k" if file.color == BLACK else "K"
-                    case file if isinstance(file, Queen):
-                        fen_str += "q" if file.color == BLACK else "Q"
-                    case ' ':
-                        space_count += 1
-
-            fen_str += (str(space_count) if space_count > 0 else '') + "/"
-        return fen_str[:-1]
+                rank.append(FEN_SYMBOLS[piece.kind + COLOR_OFFSET[piece.color]])
+            if space_count:
+                rank.append(FEN_DIGITS[space_count])
+            ranks.append(''.join(rank))
+
+        castling = ''.join(symbol for symbol, allowed in zip("KQkq", self._castling_state()) if allowed) or '-'
+        en_passant = self.coords_to_file_rank(*self.en_passant_target).lower() if self.en_passant_target else '-'
+        return ' '.join(('/'.join(ranks), 'w' if self.turn == WHITE else 'b', castling, en_passant, str(self.halfmove_clock), str(self.fullmove_number)))
 
     @staticmethod
     def file_rank_to_coords(file, rank):
@@ -405,6 +787,75 @@ class ChessBoard:
     def coords_to_file_rank(row, col):
         return chr(ord('A') + col) + str(8 - row)
 
+    @staticmethod
+    def move_to_file_rank(move):
+        """Write a move the way play_vs_bot logs it, e.g. E2E4, with any promotion piece appended (A7A8q)."""
+        text = ChessBoard.coords_to_file_rank(*move[0]) + ChessBoard.coords_to_file_rank(*move[1])
+        return text + move[2] if len(move) == 3 else text
+
+    @staticmethod
+    def file_rank_to_move(text):
+        """Read a move written by move_to_file_rank, in either case. Raises ValueError if it isn't one."""
+        if len(text) not in (4, 5) or text[0].upper() not in "ABCDEFGH" or text[2].upper() not in "ABCDEFGH" \
+                or text[1] not in "12345678" or text[3] not in "12345678" or (len(text) == 5 and text[4].lower() not in "qrbn"):
+            raise ValueError(f"Bad move {text!r}")
+        start = ChessBoard.file_rank_to_coords(text[0].upper(), text[1])
+        end = ChessBoard.file_rank_to_coords(text[2].upper(), text[3])
+        return (start, end, text[4].lower()) if len(text) == 5 else (start, end)
+
+    def encode_move(self, move):
+        """
+        Pack a move for the side to move, given as a tuple or in FileRank form (E2E4, A7A8q), into 16 bits with
+        its flag worked out from the position. A pawn reaching the last row without a choice promotes to a queen.
+        """
+        if isinstance(move, str):
+            move = self.file_rank_to_move(move)
+        (sx, sy), (ex, ey) = move[0], move[1]
+        code = sx * 8 + sy | (ex * 8 + ey) << 6
+        piece = self.board[sx][sy]
+        if piece != ' ' and piece.kind == PAWN:
+            if ex in (0, 7):
+                code |= PROMOTION_MOVE_CODES[move[2] if len(move) == 3 else 'q']
+            elif (ex, ey) == self.en_passant_target and ey != sy:
+                code |= EN_PASSANT_FLAG
+        elif piece != ' ' and piece.kind == KING and abs(ey - sy) == 2:
+            code |= CASTLING_FLAG
+        return code
+
+    def move_to_san(self, move):
+        """Write a legal move for the side to move in standard algebraic notation, as PGN uses (Nbd7, exd6, O-O, e8=Q+)."""
+        start, end = move[0], move[1]
+        piece = self.board[start[0]][start[1]]
+        square = self.coords_to_file_rank(*end).lower()
+        if piece.kind == KING and abs(end[1] - start[1]) == 2:
+            text = "O-O" if end[1] > start[1] else "O-O-O"
+        elif piece.kind == PAWN:
+            text = chr(ord("a") + start[1]) + "x" + square if end[1] != start[1] else square
+            if end[0] in (0, 7):
+                text += "=" + (move[2] if len(move) == 3 else "q").upper()
+        else:
+            # Name the file, else the rank, else both, when another piece of the same kind can reach the square
+            rivals = [
+                other[0] for other in self.legal_moves()
+                if other[1] == end and other[0] != start and self.board[other[0][0]][other[0][1]].kind == piece.kind
+            ]
+            file, rank = self.coords_to_file_rank(*start).lower()
+            if not rivals:
+                origin = ""
+            elif all(other[1] != start[1] for other in rivals):
+                origin = file
+            elif all(other[0] != start[0] for other in rivals):
+                origin = rank
+            else:
+                origin = file + rank
+            text = FEN_SYMBOLS[piece.kind] + origin + ("x" if self.board[end[0]][end[1]] != " " else "") + square
+
+        undo = self.make_move(move)
+        if self.is_in_check(self.turn):
+            text += "#" if not self.legal_moves() else "+"
+        self.unmake_move(undo)
+        return text
+
     #creates the starting layout of the chessboard.Each list contains the pieces in their starting positions, with the black pieces at the top and white pieces at the bottom. Empty squares are represented by spaces 
     def initialize_board(self):
         return [
@@ -442,46 +893,125 @@ class ChessBoard:
         return piece.valid_moves(self, pos, self.en_passant_target)
 
     def move_piece(self, start, end, choice=None):
+        if self.get_piece(start) == ' ':
+            self.remove_piece(end)
+            return
+        self._apply_move(start, end, choice)
+
+    def make_move(self, move, choice="q"):
+        """
+        Play a move ((row, col), (row, col)) in place, switch the turn and return an undo record for unmake_move.
+        A third element in the move overrides the promotion choice.
+        """
+        if len(move) == 3:
+            choice = move[2]
+        undo = self._apply_move(move[0], move[1], choice)
+        self.turn = BLACK if self.turn == WHITE else WHITE
+        return undo
+
+    def make_move_code(self, code):
+        """make_move for a move encoded as by generate_moves or encode_move. Returns the same undo record."""
+        undo = self._apply_move(SQUARE_POS[code & 63], SQUARE_POS[code >> 6 & 63], PROMOTION_PIECES[code >> 12 & 3])
+        self.turn = BLACK if self.turn == WHITE else WHITE
+        return undo
+
+    def unmake_move(self, undo):
+        """Restore the exact position from before the make_move call that returned undo."""
+        start, end, piece, has_moved, captured, captured_pos, rook_move, en_passant_target, castling, turn, key, halfmove_clock, fullmove_number = undo
+
+        # Take back the moving piece, which may have been replaced by a promoted one
+        self.remove_piece(end)
+        self.put_piece(start, piece)
+        piece.has_moved = has_moved
+
+        if captured != ' ':
+            self.put_piece(captured_pos, captured)
+
+        # Put the castling rook back in its corner
+        if rook_move is not None:
+            rook_start, rook_end, rook_has_moved = rook_move
+            rook = self.remove_piece(rook_end)
+            self.put_piece(rook_start, rook)
+            rook.has_moved = rook_has_moved
+
+        self.en_passant_target = en_passant_target
+        rights = self.castling_rights
+        rights[WHITE]['kingside'], rights[WHITE]['queenside'], rights[BLACK]['kingside'], rights[BLACK]['queenside'] = castling
+        self._turn = turn
+        self.zobrist_key = key
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.key_history.pop()
+
+    def _apply_move(self, start, end, choice):
         sx, sy = start
         ex, ey = end
         piece = self.get_piece(start)
+        rights = self.castling_rights
+        castling = self._castling_state()
+        en_passant_target = self.en_passant_target
+        key = self.zobrist_key
+        self.key_history.append(key)
+        has_moved = piece.has_moved
+        captured_pos = end
+        rook_move = None
 
         # Check for en passant
-        if isinstance(piece, Pawn):
-            if (ex, ey) == self.en_passant_target:  # Check if it's an en passant move
-                if piece.color == WHITE:
-                    self.board[sx][ey] = ' '  # Remove the captured black pawn
-                else:
-                    self.board[sx][ey] = ' '  # Remove the captured white pawn
-                self.en_passant_target = None  # Reset en passant target
+        if isinstance(piece, Pawn) and (ex, ey) == en_passant_target and ey != sy and self.board[ex][ey] == ' ':
+            captured_pos = (sx, ey)  # The captured pawn sits beside the moving pawn, not on the target square
 
         # Castling move
         if isinstance(piece, King) and abs(ey - sy) == 2:
-            if ey > sy:  # Kingside castling
-                self.board[sx][sy + 1] = self.board[sx][7]  # Move the rook
-                self.board[sx][7] = ' '
-            else:  # Queenside castling
-                self.board[sx][sy - 1] = self.board[sx][0]  # Move the rook
-                self.board[sx][0] = ' '
+            rook_start, rook_end = ((sx, 7), (sx, sy + 1)) if ey > sy else ((sx, 0), (sx, sy - 1))
+            rook = self.remove_piece(rook_start)
+            rook_move = (rook_start, rook_end, rook.has_moved)
+            self.put_piece(rook_end, rook)  # Move the rook
+            rook.has_moved = True
 
         # Move the piece
-        self.board[ex][ey] = piece
-        self.board[sx][sy] = ' '
+        captured = self.remove_piece(captured_pos)
+        self.remove_piece(start)
+        self.put_piece(end, piece)
 
-        if piece != ' ':
-            piece.has_moved = True  # Mark the piece as having moved
+        piece.has_moved = True  # Mark the piece as having moved
 
         # Handle pawn promotion
-        if piece.__repr__() in "♟♙":
+        if isinstance(piece, Pawn):
             if (piece.color == BLACK and ex == 7) or (piece.color == WHITE and ex == 0):
                 promoted_piece = piece.pawn_promotion(ex, ey,choice)  # Promote the pawn
-                self.board[ex][ey] = promoted_piece  # Place the promoted piece on the board
-            else:
-                self.board[ex][ey] = piece  # Just move the pawn if not promoted
+                self.remove_piece(end)
+                self.put_piece(end, promoted_piece)  # Place the promoted piece on the board
 
-        # Set en passant target
+        # Set en passant target, which only lasts for the reply to a double pawn push
         if isinstance(piece, Pawn) and abs(sx - ex) == 2:
-            self.en_passant_target = ((sx + ex) // 2, sy)  # Set the en passant target
+            self.en_passant_target = ((sx + ex) // 2, sy)
+        else:
+            self.en_passant_target = None
+
+        # A king move loses both castling rights, a rook leaving or being captured on its corner loses that side
+        if isinstance(piece, King):
+            rights[piece.color]['kingside'] = rights[piece.color]['queenside'] = False
+        for pos in (start, end):
+            if pos in CASTLING_CORNERS:
+                color, side = CASTLING_CORNERS[pos]
+                rights[color][side] = False
+
+        # Piece moves were hashed by put_piece/remove_piece, swap in the new castling and en passant state
+        if en_passant_target is not None or self.en_passant_target is not None or castling != self._castling_state():
+            self.zobrist_key ^= self._state_key(castling, en_passant_target) ^ self._state_key(self._castling_state(), self.en_passant_target)
+
+        undo = (start, end, piece, has_moved, captured, captured_pos, rook_move, en_passant_target, castling, self.turn, key,
+                self.halfmove_clock, self.fullmove_number)
+
+        # Captures and pawn moves reset the fifty-move count, and a full move ends with black's move
+        if captured != ' ' or isinstance(piece, Pawn):
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if piece.color == BLACK:
+            self.fullmove_number += 1
+
+        return undo
 
     def is_valid_move(self, start, end):
         piece = self.get_piece(start)
@@ -499,76 +1029,219 @@ class ChessBoard:
         return True
         
     def is_in_check(self, color):
-        # Simplified check detection logic
         king_pos = self.find_king(color)
-        for x in range(8):
-            for y in range(8):
-                target_piece = self.get_piece((x, y))
-                if target_piece != ' ' and target_piece.color != color:
-                    if king_pos in target_piece.valid_moves(self, (x, y)):
-                        return True
-        return False
+        if king_pos is None:
+            return False
+        return self.attacks_to(king_pos, BLACK if color == WHITE else WHITE) != 0
 
     def is_checkmate(self):
-        for x in range(8):
-            for y in range(8):
-                piece = self.get_piece((x, y))
-                if piece != ' ' and piece.color == self.turn:
-                    for move in piece.valid_moves(self, (x, y)):
-                        start = (x, y)
-                        end = move
-                        captured_piece = self.get_piece(end)  # Save the captured piece
-                        
-                        # Manually update the board state
-                        self.board[end[0]][end[1]] = piece
-                        self.board[start[0]][start[1]] = ' '
-                        
-                        if not self.is_in_check(self.turn):
-                            # Undo the move
-                            self.board[start[0]][start[1]] = piece
-                            self.board[end[0]][end[1]] = captured_piece
-                            return False
-                        
-                        # Undo the move
-                        self.board[start[0]][start[1]] = piece
-                        self.board[end[0]][end[1]] = captured_piece
-        return True
-    
+        return self.is_in_check(self.turn) and not self.legal_moves()
+
+    def repetition_count(self):
+        """
+        How many times the current position has come up, this time included. Captures and pawn moves can't be
+        undone, so only the last halfmove_clock positions can match, and of those only every other one has
+        the same side to move.
+        """
+        key = self.zobrist_key
+        history = self.key_history
+        count = 1
+        for i in range(len(history) - 4, max(len(history) - self.halfmove_clock, 0) - 1, -2):
+            if history[i] == key:
+                count += 1
+        return count
+
+    def is_repetition(self):
+        """Whether the current position has come up before. Stops at the first match, so cheaper than repetition_count."""
+        key = self.zobrist_key
+        history = self.key_history
+        for i in range(len(history) - 4, max(len(history) - self.halfmove_clock, 0) - 1, -2):
+            if history[i] == key:
+                return True
+        return False
+
+    def outcome(self):
+        """Return (result, reason) once the game is over, e.g. ("1-0", "checkmate"), or None while it goes on."""
+        if not self.legal_moves():
+            if self.is_in_check(self.turn):
+                return ("0-1" if self.turn == WHITE else "1-0"), "checkmate"
+            return "1/2-1/2", "stalemate"
+        if self.halfmove_clock >= 100:
+            return "1/2-1/2", "fifty-move rule"
+        if self.repetition_count() >= 3:
+            return "1/2-1/2", "threefold repetition"
+        return None
+
+    def is_draw_by_rule(self):
+        """Threefold repetition, or fifty moves by each side with no capture or pawn move (unless the last one mated)."""
+        if self.halfmove_clock >= 100 and not self.is_checkmate():
+            return True
+        return self.repetition_count() >= 3
+
+    def legal_moves(self, color=None):
+        """
+        Return every legal move for color (the side to move by default) as ((row, col), (row, col)) tuples.
+        Promotions are listed once per piece as ((row, col), (row, col), choice).
+        """
+        buffer = new_move_buffer()
+        count = self.generate_moves(buffer, color)
+        return [decode_move(code) for code in buffer[:count]]
+
+    def generate_moves(self, buffer, color=None):
+        """
+        Write every legal move for color (the side to move by default) into buffer, encoded as 16-bit numbers,
+        and return how many there are. The buffer is one from new_move_buffer(), reused from call to call, so
+        generating moves doesn't allocate a list or tuple per move.
+
+        Checks and pins are worked out once for the position and turned into masks of allowed target
+        squares, so moves don't have to be played out to see whether they leave the king in check.
+        """
+        color = color or self.turn
+        enemy = BLACK if color == WHITE else WHITE
+        bitboards = self.bitboards
+        off = COLOR_OFFSET[color]
+        own = self.occupancy[color]
+        count = 0
+
+        check_mask = ALL_SQUARES  # Squares a non-king move may land on
+        pins = {}  # Pinned piece square -> squares along its pin line
+        king_bb = bitboards[KING + off]
+        if king_bb:
+            ksq = king_bb.bit_length() - 1
+            king_pos = SQUARE_POS[ksq]
+            checkers = self.attacks_to(king_pos, enemy)
+
+            # The king can't step onto an attacked square. It is lifted off the board while testing, so a
+            # slider checking along a line still covers the square behind the king
+            self.occupied ^= king_bb
+            for sq in iter_squares(KING_ATTACKS[ksq] & ~own):
+                if not self.attacks_to(SQUARE_POS[sq], enemy):
+                    buffer[count] = ksq | sq << 6
+                    count += 1
+            self.occupied ^= king_bb
+            king = self.board[king_pos[0]][king_pos[1]]
+            if not king.has_moved and ksq & 7 == 4:  # Castling tests its own squares against the attack map
+                rights = self.castling_rights[color]
+                if rights['kingside'] and king._can_castle_kingside(self, king_pos):
+                    buffer[count] = ksq | (ksq + 2) << 6 | CASTLING_FLAG
+                    count += 1
+                if rights['queenside'] and king._can_castle_queenside(self, king_pos):
+                    buffer[count] = ksq | (ksq - 2) << 6 | CASTLING_FLAG
+                    count += 1
+
+            if checkers & (checkers - 1):  # Double check, only the king can move
+                return count
+            if checkers:  # Single check, capture the checker or block the line between it and the king
+                check_mask = checkers | BETWEEN[ksq][checkers.bit_length() - 1]
+
+            # Walk every line out from the king looking for one of our pieces with an enemy slider behind it
+            enemy_off = COLOR_OFFSET[enemy]
+            queens = bitboards[QUEEN + enemy_off]
+            occupied = self.occupied
+            rook_sliders = bitboards[ROOK + enemy_off] | queens
+            bishop_sliders = bitboards[BISHOP + enemy_off] | queens
+            for d in range(8):
+                sliders = rook_sliders if d < 4 else bishop_sliders
+                if not sliders & RAY_MASKS[d][ksq]:
+                    continue
+                ray = 0
+                pinned = None
+                for target, bit in RAYS[d][ksq]:
+                    ray |= bit
+                    if occupied & bit:
+                        if own & bit and pinned is None:
+                            pinned = bit.bit_length() - 1
+                        else:
+                            if pinned is not None and sliders & bit:
+                                pins[pinned] = ray
+                            break
+
+        # The other pieces in square order. Pawns push onto empty squares, two from their starting row, and capture diagonally
+        occupied = self.occupied
+        squares = self.board
+        targets_allowed = ~own & check_mask
+        pawn_attacks = PAWN_ATTACKS[color]
+        step, start_row = (-8, 6) if color == WHITE else (8, 1)
+        enemies = self.occupancy[enemy]
+        en_passant_target = self.en_passant_target
+        en_passant_sq = en_passant_target[0] * 8 + en_passant_target[1] if en_passant_target is not None else -1
+        for sq in iter_squares(own ^ king_bb):
+            kind = squares[sq >> 3][sq & 7].kind
+            if kind != PAWN:
+                if kind == KNIGHT:
+                    targets = KNIGHT_ATTACKS[sq]
+                elif kind == BISHOP:
+                    targets = bishop_attacks(sq, occupied)
+                elif kind == ROOK:
+                    targets = rook_attacks(sq, occupied)
+                else:
+                    targets = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                targets &= targets_allowed
+                if sq in pins:
+                    targets &= pins[sq]
+                for end in iter_squares(targets):
+                    buffer[count] = sq | end << 6
+                    count += 1
+                continue
+
+            targets = pawn_attacks[sq] & enemies
+            forward = sq + step
+            if 0 <= forward < 64 and not occupied >> forward & 1:
+                targets |= 1 << forward
+                if sq >> 3 == start_row and not occupied >> (forward + step) & 1:
+                    targets |= 1 << (forward + step)
+            targets &= check_mask
+            if sq in pins:
+                targets &= pins[sq]
+            for end in iter_squares(targets):
+                if end < 8 or end >= 56:
+                    for code in PROMOTION_MOVE_CODES.values():
+                        buffer[count] = sq | end << 6 | code
+                        count += 1
+                else:
+                    buffer[count] = sq | end << 6
+                    count += 1
+            if en_passant_sq >= 0 and pawn_attacks[sq] >> en_passant_sq & 1:
+                # En passant takes two pawns off one row, which can uncover a check the masks don't describe.
+                # It is rare enough to just play it out
+                undo = self._apply_move(SQUARE_POS[sq], en_passant_target, "q")
+                legal = not self.is_in_check(color)
+                self.unmake_move(undo)
+                if legal:
+                    buffer[count] = sq | en_passant_sq << 6 | EN_PASSANT_FLAG
+                    count += 1
+        return count
+
     def is_under_attack(self, pos, color):
         """Check if a square is under attack by any opponent's piece."""
-        for x in range(8):
-            for y in range(8):
-                piece = self.get_piece((x, y))
-                if piece != ' ' and piece.color != color:
-                    if pos in piece.valid_moves(self, (x, y)):
-                        return True
-        return False
+        return self.attacks_to(pos, BLACK if color == WHITE else WHITE) != 0
     
     def find_king(self, color):
         """Find the position of the king of the given color."""
-        for x in range(8):
-            for y in range(8):
-                piece = self.get_piece((x, y))
-                if isinstance(piece, King) and piece.color == color:
-                    return (x, y)
-        return None
+        bb = self.bitboards[KING + COLOR_OFFSET[color]]
+        if not bb:
+            return None
+        return divmod((bb & -bb).bit_length() - 1, 8)
     
     def move_leaves_king_in_check(self, start, end):
         """Simulate a move and check if it leaves the king in check."""
         in_check = False
         piece = self.get_piece(start)
-        captured_piece = self.get_piece(end)
+        if piece == " ":
+            return in_check
         
         # Simulate the move
-        self.board[end[0]][end[1]] = piece
-        self.board[start[0]][start[1]] = ' '
+        captured_piece = self.remove_piece(end)
+        self.remove_piece(start)
+        self.put_piece(end, piece)
         
-        if piece != " ":
-            in_check = self.is_in_check(piece.color)
+        in_check = self.is_in_check(piece.color)
         
         # Undo the move
-        self.board[start[0]][start[1]] = piece
-        self.board[end[0]][end[1]] = captured_piece
+        self.remove_piece(end)
+        self.put_piece(start, piece)
+        if captured_piece != ' ':
+            self.put_piece(end, captured_piece)
         
         return in_check
 
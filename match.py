@@ -0,0 +1,350 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bot import Bot, DEFAULT_BOOK, MAX_PLY, NO_MOVE
+from game import ChessBoard, WHITE, BLACK
+from tablebase import DEFAULT_DIRECTORY as DEFAULT_TABLEBASE
+
+START_FEN = ChessBoard().get_fen()
+DEFAULT_DEPTH = 3  # Used when an engine sets no depth, time or node limit
+DEFAULT_MAX_PLIES = 400  # Games still going after this many plies are scored as draws
+DEFAULT_OPENING_PLIES = 8  # Plies played from each line of an openings file of moves
+DEFAULT_PGN = "match.pgn"
+
+# Settings an engine can be given on the command line, with their defaults
+ENGINE_DEFAULTS = {
+    "depth": None,  # Deepest iteration to search
+    "movetime": None,  # Milliseconds per move
+    "nodes": None,  # Nodes per move, quiescence included
+    "hash": 16,  # Transposition table size in MB
+    "quiescence": True,
+    "book": False,  # Off by default so the engines' own search is what gets measured
+    "tablebase": True,
+}
+BOOLEANS = {"on": True, "true": True, "yes": True, "1": True, "off": False, "false": False, "no": False, "0": False}
+
+_worker_bots = {}  # Engine name -> Bot, one set per worker process, reused for every game it plays
+
+
+def parse_engine(text):
+    """
+    Read an engine configuration written as comma-separated settings, e.g. 'depth=4,quiescence=off', into a dict
+    with every key of ENGINE_DEFAULTS. Raises ValueError for an unknown setting or a bad value.
+    """
+    config = dict(ENGINE_DEFAULTS)
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip().lower()
+        if name not in ENGINE_DEFAULTS:
+            raise ValueError(f"unknown engine setting {name!r}")
+        if isinstance(ENGINE_DEFAULTS[name], bool):
+            if value.strip().lower() not in BOOLEANS:
+                raise ValueError(f"{name} should be on or off, not {value!r}")
+            config[name] = BOOLEANS[value.strip().lower()]
+        else:
+            config[name] = int(value)
+    if config["depth"] is None and config["movetime"] is None and config["nodes"] is None:
+        config["depth"] = DEFAULT_DEPTH
+    return config
+
+
+def read_openings(stream, plies=DEFAULT_OPENING_PLIES):
+    """
+    Read starting positions, one per line, as a list of (FEN, moves) pairs. A line is either a FEN or a move
+    sequence in play_vs_bot's notation, as in openings.txt, of which the first `plies` moves are played from the
+    start. Blank lines and lines starting with '#' are skipped. Raises ValueError for a position that can't be read.
+    """
+    openings = []
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "/" in line:
+            ChessBoard.from_fen(line)
+            openings.append((line, []))
+            continue
+        moves = line.split()[:plies]
+        board = ChessBoard()
+        for text in moves:
+            move = ChessBoard.file_rank_to_move(text)
+            if move not in board.legal_moves():
+                raise ValueError(f"illegal move {text} in opening {line!r}")
+            board.make_move(move)
+        openings.append((START_FEN, moves))
+    return openings
+
+
+def _worker_bot(name, config):
+    bot = _worker_bots.get(name)
+    if bot is None:
+        bot = Bot(
+            tt_size_mb=config["hash"],
+            book=DEFAULT_BOOK if config["book"] and os.path.exists(DEFAULT_BOOK) else None,
+            tablebase=DEFAULT_TABLEBASE if config["tablebase"] and os.path.isdir(DEFAULT_TABLEBASE) else None,
+            quiescence=config["quiescence"],
+        )
+        _worker_bots[name] = bot
+    return bot
+
+
+def play_game(number, opening, white, black, max_plies=DEFAULT_MAX_PLIES):
+    """
+    Play one game between two engines, each given as (name, config), from an opening as read by read_openings().
+    Runs in a worker process. Returns a dict with the moves in SAN, the result and its reason, and for each
+    engine the moves it searched (book moves aside) with the nodes, seconds and depth they took.
+    """
+    fen, opening_moves = opening
+    board = ChessBoard.from_fen(fen)
+    san = []
+    for text in opening_moves:
+        move = ChessBoard.file_rank_to_move(text)
+        san.append(board.move_to_san(move))
+        board.make_move(move)
+
+    engines = {WHITE: white, BLACK: black}
+    usage = {name: {"moves": 0, "book_moves": 0, "nodes": 0, "seconds": 0.0, "depth": 0} for name, _ in (white, black)}
+    for name, config in (white, black):
+        bot = _worker_bot(name, config)
+        bot.tt.clear()  # Each game starts with nothing remembered from the last
+
+    result = board.outcome()
+    while result is None and len(san) < max_plies:
+        name, config = engines[board.turn]
+        bot = _worker_bot(name, config)
+        start = time.perf_counter()
+        _, move = bot.search(
+            board, time_limit_ms=config["movetime"], max_depth=config["depth"] or MAX_PLY, node_limit=config["nodes"]
+        )
+        seconds = time.perf_counter() - start
+        if move is None or move == NO_MOVE:
+            raise RuntimeError(f"{name} found no move in {board.get_fen()}")
+        entry = usage[name]
+        if bot.stats.nodes == 0:  # Answered from the opening book
+            entry["book_moves"] += 1
+        else:
+            entry["moves"] += 1
+            entry["nodes"] += bot.stats.nodes + bot.stats.qnodes
+            entry["seconds"] += seconds
+            entry["depth"] += bot.depth_reached
+        san.append(board.move_to_san(move))
+        board.make_move(move)
+        result = board.outcome()
+
+    result, reason = result if result is not None else ("1/2-1/2", "move limit")
+    return {
+        "round": number,
+        "white": white[0],
+        "black": black[0],
+        "fen": fen,
+        "moves": san,
+        "result": result,
+        "reason": reason,
+        "usage": usage,
+    }
+
+
+def elo_difference(wins, draws, losses):
+    """
+    Elo difference implied by a score, with its 95% confidence interval: (elo, low, high). The interval comes from
+    the spread of the per-game scores around their mean. Infinite at either end where the score is 0% or 100%.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return _elo(score), _elo(score - margin), _elo(score + margin)
+
+
+def _elo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1) + 0.0  # + 0.0 turns an even score's -0.0 into 0.0
+
+
+def game_to_pgn(game, event="Self-play match", date=None):
+    """Write a game returned by play_game() as PGN text, with the position set up by FEN when it isn't the start."""
+    headers = [
+        ("Event", event),
+        ("Site", "?"),
+        ("Date", date or time.strftime("%Y.%m.%d")),
+        ("Round", str(game["round"])),
+        ("White", game["white"]),
+        ("Black", game["black"]),
+        ("Result", game["result"]),
+    ]
+    if game["fen"] != START_FEN:
+        headers += [("SetUp", "1"), ("FEN", game["fen"])]
+    headers.append(("Termination", game["reason"]))
+
+    board = ChessBoard.from_fen(game["fen"])
+    number, white_to_move = board.fullmove_number, board.turn == WHITE
+    tokens = []
+    for i, move in enumerate(game["moves"]):
+        if white_to_move:
+            tokens.append(f"{number}.")
+        elif i == 0:
+            tokens.append(f"{number}...")
+        tokens.append(move)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(game["result"])
+
+    lines, line = [], ""
+    for token in tokens:  # PGN lines stay under 80 characters
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "".join(f'[{name} "{value}"]\n' for name, value in headers) + "\n" + "\n".join(lines) + "\n"
+
+
+def run_match(engine1, engine2, openings, games, workers=None, max_plies=DEFAULT_MAX_PLIES, out=sys.stdout):
+    """
+    Play games between two engines, each given as (name, config), across a process pool. Each opening is played
+    twice with the colours swapped, going round the openings as often as `games` needs. Progress is written to
+    out as games finish. Returns the finished games in round order. A game that fails is reported to stderr and
+    left out, so one engine error doesn't throw away the rest of the match.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for i in range(games):
+            opening = openings[i // 2 % len(openings)]
+            white, black = (engine1, engine2) if i % 2 == 0 else (engine2, engine1)
+            futures[pool.submit(play_game, i + 1, opening, white, black, max_plies)] = i + 1
+        for future in as_completed(futures):
+            try:
+                game = future.result()
+            except Exception as e:
+                print(f"game {futures[future]}/{games} failed: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+                continue
+            results.append(game)
+            if out is not None:
+                print(
+                    f"game {game['round']}/{games}: {game['white']} - {game['black']} {game['result']} "
+                    f"({game['reason']}, {len(game['moves'])} plies)",
+                    file=out, flush=True,
+                )
+    results.sort(key=lambda game: game["round"])
+    return results
+
+
+def summarize(games, engine1, engine2):
+    """
+    Totals for a finished match: engine1's wins, draws and losses with the Elo difference, and for each engine its
+    nodes per second, average depth reached and average time per searched move.
+    """
+    wins = draws = losses = 0
+    usage = {name: {"moves": 0, "book_moves": 0, "nodes": 0, "seconds": 0.0, "depth": 0} for name in (engine1, engine2)}
+    for game in games:
+        if game["result"] == "1/2-1/2":
+            draws += 1
+        elif (game["result"] == "1-0") == (game["white"] == engine1):
+            wins += 1
+        else:
+            losses += 1
+        for name, counts in game["usage"].items():
+            for key, value in counts.items():
+                usage[name][key] += value
+
+    elo, low, high = elo_difference(wins, draws, losses)
+    engines = {}
+    for name, counts in usage.items():
+        moves = counts["moves"]
+        engines[name] = {
+            "moves": moves,
+            "book_moves": counts["book_moves"],
+            "nps": int(counts["nodes"] / counts["seconds"]) if counts["seconds"] > 0 else 0,
+            "average_depth": round(counts["depth"] / moves, 2) if moves else 0.0,
+            "ms_per_move": round(counts["seconds"] * 1000 / moves, 1) if moves else 0.0,
+        }
+    return {
+        "games": len(games),
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "score": (wins + draws / 2) / len(games) if games else 0.0,
+        "elo": elo,
+        "elo_low": low,
+        "elo_high": high,
+        "engines": engines,
+    }
+
+
+def print_summary(summary, engine1, engine2, out=sys.stdout):
+    print(f"{engine1} vs {engine2}: {summary['games']} games", file=out)
+    print(
+        f"  +{summary['wins']} ={summary['draws']} -{summary['losses']}, score {summary['score']:.1%}, "
+        f"Elo {summary['elo']:+.1f} (95% interval {summary['elo_low']:+.1f} to {summary['elo_high']:+.1f})",
+        file=out,
+    )
+    for name, engine in summary["engines"].items():
+        print(
+            f"  {name}: {engine['nps']} nps, depth {engine['average_depth']}, {engine['ms_per_move']} ms per move "
+            f"over {engine['moves']} searched moves ({engine['book_moves']} from the book)",
+            file=out,
+        )
+
+
+def parse_engine_argument(text):
+    """argparse type for an engine: its name (the settings as written) and its configuration."""
+    try:
+        return text or "default", parse_engine(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Play the bot against itself in two configurations and compare their strength and speed",
+        epilog=f"Engine settings are comma-separated, e.g. 'depth=4,quiescence=off'. Settings: {', '.join(ENGINE_DEFAULTS)}. "
+               f"With no depth, movetime or nodes an engine searches to depth {DEFAULT_DEPTH}.",
+    )
+    parser.add_argument("engine1", type=parse_engine_argument, help="settings of the engine being measured")
+    parser.add_argument("engine2", type=parse_engine_argument, help="settings of the engine it plays against")
+    parser.add_argument("-n", "--games", type=int, default=2, help="games to play (default 2)")
+    parser.add_argument("--openings", help="file of starting FENs or opening move lines such as openings.txt (default: the start position)")
+    parser.add_argument("--opening-plies", type=int, default=DEFAULT_OPENING_PLIES, help="plies played from each opening move line")
+    parser.add_argument("--workers", type=int, help="processes playing games at once (default: one per CPU)")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="plies after which a game is scored a draw")
+    parser.add_argument("--pgn", default=DEFAULT_PGN, help=f"file to save the games to (default {DEFAULT_PGN}, '-' for none)")
+    args = parser.parse_args(argv)
+
+    (name1, config1), (name2, config2) = args.engine1, args.engine2
+    if name1 == name2:
+        name1, name2 = name1 + " #1", name2 + " #2"
+    if args.openings:
+        with open(args.openings) as f:
+            openings = read_openings(f, args.opening_plies)
+        if not openings:
+            parser.error(f"no openings in {args.openings}")
+    else:
+        openings = [(START_FEN, [])]
+
+    start = time.perf_counter()
+    games = run_match((name1, config1), (name2, config2), openings, args.games, args.workers, args.max_plies)
+    print(f"played in {time.perf_counter() - start:.1f}s")
+    print_summary(summarize(games, name1, name2), name1, name2)
+    if args.pgn != "-":
+        with open(args.pgn, "w") as f:
+            f.write("\n".join(game_to_pgn(game) for game in games))
+        print(f"games saved to {args.pgn}")
+    if len(games) < args.games:
+        print(f"{args.games - len(games)} of {args.games} games failed and were left out", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import argparse
+import json
+import sys
+import time
+
+import game
+from game import ChessBoard
+
+# Standard perft positions with their published leaf counts, indexed by depth - 1
+# (https://www.chessprogramming.org/Perft_Results)
+SUITE = [
+    {
+        "name": "startpos",
+        "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "nodes": [20, 400, 8902, 197281, 4865609],
+    },
+    {
+        # Same position get_metrics in bot.py benchmarks the search on
+        "name": "kiwipete",
+        "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "nodes": [48, 2039, 97862, 4085603],
+    },
+    {
+        "name": "position3",
+        "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "nodes": [14, 191, 2812, 43238, 674624],
+    },
+    {
+        "name": "position4",
+        "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        "nodes": [6, 264, 9467, 422333],
+    },
+    {
+        "name": "position4-mirrored",
+        "fen": "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+        "nodes": [6, 264, 9467, 422333],
+    },
+    {
+        "name": "position5",
+        "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        "nodes": [44, 1486, 62379, 2103487],
+    },
+    {
+        "name": "position6",
+        "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        "nodes": [46, 2079, 89890, 3894594],
+    },
+]
+
+
+def perft(board: ChessBoard, depth, buffers=None):
+    """Count the leaf nodes of the legal move tree below board, depth plies deep."""
+    if depth <= 0:
+        return 1
+    if buffers is None:  # One move buffer per ply, filled again at every node of that ply
+        buffers = [game.new_move_buffer() for _ in range(depth)]
+    buffer = buffers[depth - 1]
+    count = board.generate_moves(buffer)
+    if depth == 1:
+        return count
+
+    nodes = 0
+    for i in range(count):
+        undo = board.make_move_code(buffer[i])
+        nodes += perft(board, depth - 1, buffers)
+        board.unmake_move(undo)
+    return nodes
+
+
+def divide(board: ChessBoard, depth):
+    """Return {move: leaf count} for every root move, the usual way to narrow down a perft mismatch."""
+    counts = {}
+    for move in board.legal_moves():
+        undo = board.make_move(move)
+        counts[ChessBoard.move_to_file_rank(move)] = perft(board, depth - 1)
+        board.unmake_move(undo)
+    return counts
+
+
+def run_suite(suite=SUITE, max_depth=3, out=sys.stdout):
+    """
+    Run perft on every position up to max_depth and compare with the known counts.
+    Returns a list of result dicts, one per position and depth.
+    """
+    results = []
+    for entry in suite:
+        board = ChessBoard.from_fen(entry["fen"])
+        for depth, expected in enumerate(entry["nodes"][:max_depth], start=1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            result = {
+                "name": entry["name"],
+                "fen": entry["fen"],
+                "depth": depth,
+                "nodes": nodes,
+                "expected": expected,
+                "passed": nodes == expected,
+                "seconds": round(elapsed, 6),
+                "nps": int(nodes / elapsed) if elapsed > 0 else 0,
+            }
+            results.append(result)
+            if out is not None:
+                print(
+                    f"{'ok  ' if result['passed'] else 'FAIL'} {entry['name']:<20} depth {depth}  "
+                    f"{nodes:>10} nodes (expected {expected})  {elapsed:8.3f}s  {result['nps']:>9} nps",
+                    file=out,
+                )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move-generation checks and benchmarks")
+    parser.add_argument("--fen", help="run a single position instead of the bundled suite")
+    parser.add_argument("--depth", type=int, default=3, help="depth for --fen, or the maximum depth for the suite")
+    parser.add_argument("--divide", action="store_true", help="with --fen, print the leaf count below each root move")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON to PATH ('-' for stdout)")
+    parser.add_argument("--slider-tables", action="store_true", help="use full occupancy lookup tables for sliding pieces")
+    args = parser.parse_args(argv)
+
+    if args.slider_tables:
+        game.use_slider_tables()
+
+    if args.fen:
+        board = ChessBoard.from_fen(args.fen)
+        start = time.perf_counter()
+        if args.divide:
+            counts = divide(board, args.depth)
+            nodes = sum(counts.values())
+            for move, count in sorted(counts.items()):
+                print(f"{move}: {count}")
+        else:
+            counts = None
+            nodes = perft(board, args.depth)
+        elapsed = time.perf_counter() - start
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        print(f"nodes {nodes}  time {elapsed:.3f}s  nps {nps}")
+        results = [{"fen": args.fen, "depth": args.depth, "nodes": nodes, "seconds": round(elapsed, 6), "nps": nps, "divide": counts}]
+        failed = False
+    else:
+        results = run_suite(max_depth=args.depth, out=sys.stderr if args.json == "-" else sys.stdout)
+        failed = not all(result["passed"] for result in results)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
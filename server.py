@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from bot import Bot, DEFAULT_BOOK, NO_MOVE
+from game import ChessBoard, WHITE, BLACK
+from tablebase import DEFAULT_DIRECTORY as DEFAULT_TABLEBASE
+
+DEFAULT_PORT = 7878
+DEFAULT_MOVETIME_MS = 1000  # Bot thinking time per move, unless a game asks for less
+MIN_MOVETIME_MS = 10  # Least thinking time a game can ask for
+DEFAULT_MAX_GAMES = 10_000
+DEFAULT_LOG_DIR = "logs"
+MAX_LINE = 1024  # Longest command accepted, so a client can't make the server buffer without limit
+
+HELP = """commands:
+  new [white|black] [movetime MS] [fen FEN]   start a game where you play the given side (white by default)
+  move GAME MOVE                              play a move such as E2E4 or A7A8q; the bot answers with its own
+  fen GAME                                    show the position
+  moves GAME                                  list the moves played so far
+  end GAME                                    resign or leave the game
+  games                                       list your open games
+  quit                                        close the connection"""
+
+_worker_bot = None  # One Bot per worker process, reused for every search it runs
+
+
+def _init_worker(book, tablebase):
+    global _worker_bot
+    _worker_bot = Bot(book=book, tablebase=tablebase)
+
+
+def _search(fen, key_history, movetime_ms):
+    """Runs in a worker process. Returns the bot's move for the position, written as in the move logs, or None."""
+    board = ChessBoard.from_fen(fen)
+    board.key_history = list(key_history)
+    _, move = _worker_bot.search(board, time_limit_ms=movetime_ms)
+    if move is None or move == NO_MOVE:
+        return None
+    return ChessBoard.move_to_file_rank(move)
+
+
+class Game:
+    """One game between a client and the bot, with the moves played so far in play_vs_bot's notation."""
+
+    def __init__(self, game_id, board, bot_color, movetime_ms):
+        self.id = game_id
+        self.board = board
+        self.bot_color = bot_color
+        self.movetime_ms = movetime_ms
+        self.moves = []
+        self.result = None  # (result, reason) once the game is over
+
+    def play(self, move):
+        self.board.make_move(move)
+        self.moves.append(ChessBoard.move_to_file_rank(move))
+        self.result = self.board.outcome()
+
+
+class GameServer:
+    """
+    Hosts many games over a line-based TCP protocol (see HELP). Games live in memory, and bot searches run
+    in a bounded process pool so the event loop only ever waits on them.
+
+    Backpressure: each connection is served one command at a time and its replies are drained before the
+    next line is read, so a client that sends faster than the bot plays just fills its socket buffer. At most
+    max_pending searches are queued for the pool across all clients; further ones wait their turn.
+    """
+
+    def __init__(self, workers=None, movetime_ms=DEFAULT_MOVETIME_MS, max_games=DEFAULT_MAX_GAMES, max_pending=None,
+                 log_dir=DEFAULT_LOG_DIR, book=None, tablebase=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.movetime_ms = movetime_ms
+        self.max_games = max_games
+        self.searches = asyncio.Semaphore(max_pending or self.workers * 2)
+        self.log_dir = log_dir
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(book, tablebase))
+        self.games = {}  # Game id -> Game, across every connection
+        self.ids = itertools.count(1)
+        self.commands = {
+            "new": self.cmd_new,
+            "move": self.cmd_move,
+            "fen": self.cmd_fen,
+            "moves": self.cmd_moves,
+            "end": self.cmd_end,
+            "games": self.cmd_games,
+            "help": self.cmd_help,
+        }
+        os.makedirs(log_dir, exist_ok=True)
+
+    async def handle_client(self, reader, writer):
+        owned = set()  # Ids of the games this connection started, closed with it
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(b"error line too long\n")
+                    break
+                if not line:
+                    break
+                words = line.decode(errors="replace").split()
+                if not words:
+                    continue
+                if words[0] == "quit":
+                    break
+                command = self.commands.get(words[0])
+                if command is None:
+                    replies = [f"error unknown command {words[0]!r}, try help"]
+                else:
+                    try:
+                        replies = await command(owned, words[1:])
+                    except ValueError as e:
+                        replies = [f"error {e}"]
+                writer.write("".join(reply + "\n" for reply in replies).encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in list(owned):
+                await self.close_game(owned, game_id, "disconnected")
+            writer.close()
+
+    def _game(self, owned, words):
+        if not words or not words[0].isdigit() or int(words[0]) not in owned:
+            raise ValueError(f"no game {words[0] if words else ''}".rstrip())
+        return self.games[int(words[0])]
+
+    async def cmd_new(self, owned, words):
+        if len(self.games) >= self.max_games:
+            raise ValueError("server full")
+        player = WHITE
+        movetime_ms = self.movetime_ms
+        board = None
+        i = 0
+        while i < len(words):
+            if words[i] in (WHITE, BLACK):
+                player = words[i]
+                i += 1
+            elif words[i] == "movetime" and i + 1 < len(words) and words[i + 1].isdigit():
+                # A game can ask for less time, never more, and not so little the search has no time at all
+                movetime_ms = max(MIN_MOVETIME_MS, min(int(words[i + 1]), self.movetime_ms))
+                i += 2
+            elif words[i] == "fen":
+                board = ChessBoard.from_fen(" ".join(words[i + 1:]))
+                break
+            else:
+                raise ValueError(f"bad option {words[i]!r}")
+
+        game = Game(next(self.ids), board or ChessBoard(), BLACK if player == WHITE else WHITE, movetime_ms)
+        self.games[game.id] = game
+        owned.add(game.id)
+        replies = [f"game {game.id} {player} {game.board.get_fen()}"]
+        game.result = game.board.outcome()
+        if game.result is not None:  # Set up from a finished position
+            replies += await self.finish(owned, game)
+        elif game.board.turn == game.bot_color:
+            replies += await self.bot_move(owned, game)
+        return replies
+
+    async def cmd_move(self, owned, words):
+        game = self._game(owned, words)
+        if len(words) != 2:
+            raise ValueError("usage: move GAME MOVE")
+        if game.result is not None:
+            raise ValueError(f"game {game.id} is over")
+        if game.board.turn == game.bot_color:
+            raise ValueError(f"not your turn in game {game.id}")
+        move = ChessBoard.file_rank_to_move(words[1])
+        legal = game.board.legal_moves()
+        if len(move) == 2 and move + ("q",) in legal:  # A promotion with no piece given makes a queen
+            move += ("q",)
+        if move not in legal:
+            raise ValueError(f"illegal move {words[1]}")
+
+        game.play(move)
+        if game.result is not None:
+            return await self.finish(owned, game)
+        return await self.bot_move(owned, game)
+
+    async def bot_move(self, owned, game):
+        """
+        Play the bot's move in game. A search that fails or comes back without a move ends that game only, with
+        an error reply, since it can't go on without the bot's move; the connection and its other games carry on.
+        """
+        async with self.searches:
+            loop = asyncio.get_running_loop()
+            try:
+                text = await loop.run_in_executor(
+                    self.pool, _search, game.board.get_fen(), game.board.key_history, game.movetime_ms
+                )
+            except Exception as e:
+                print(f"game {game.id}: search failed: {type(e).__name__}: {e}", file=sys.stderr)
+                text = None
+        if text is None:
+            await self.close_game(owned, game.id, "bot search failed")
+            return [f"error game {game.id} ended, the bot's search failed"]
+        game.play(ChessBoard.file_rank_to_move(text))
+        replies = [f"bestmove {game.id} {text}"]
+        if game.result is not None:
+            replies += await self.finish(owned, game)
+        return replies
+
+    async def finish(self, owned, game):
+        result, reason = game.result
+        await self.close_game(owned, game.id, reason)
+        return [f"result {game.id} {result} {reason}"]
+
+    async def cmd_fen(self, owned, words):
+        game = self._game(owned, words)
+        return [f"fen {game.id} {game.board.get_fen()}"]
+
+    async def cmd_moves(self, owned, words):
+        game = self._game(owned, words)
+        return [f"moves {game.id} {' '.join(game.moves)}".rstrip()]
+
+    async def cmd_end(self, owned, words):
+        game = self._game(owned, words)
+        await self.close_game(owned, game.id, "ended by player")
+        return [f"ended {game.id}"]
+
+    async def cmd_games(self, owned, words):
+        return [f"games {' '.join(str(game_id) for game_id in sorted(owned))}".rstrip()]
+
+    async def cmd_help(self, owned, words):
+        return HELP.splitlines()
+
+    async def close_game(self, owned, game_id, reason):
+        """Forget a game and write its move log, one move per line like prev.txt, to log_dir/game-<id>.txt."""
+        owned.discard(game_id)
+        game = self.games.pop(game_id, None)
+        if game is None:
+            return
+        lines = game.moves + [f"# {game.result[0] if game.result else '*'} {reason}"]
+        path = os.path.join(self.log_dir, f"game-{game.id}.txt")
+        await asyncio.get_running_loop().run_in_executor(None, _write_log, path, lines)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def _write_log(path, lines):
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+async def serve(host, port, **options):
+    game_server = GameServer(**options)
+    server = await asyncio.start_server(game_server.handle_client, host, port, limit=MAX_LINE)
+    print(f"listening on {', '.join(str(sock.getsockname()) for sock in server.sockets)}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        game_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve bot games over a line-based TCP protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, help="search processes (default: one per CPU)")
+    parser.add_argument("--movetime", type=int, default=DEFAULT_MOVETIME_MS, help="most milliseconds the bot thinks per move")
+    parser.add_argument("--max-games", type=int, default=DEFAULT_MAX_GAMES, help="open games allowed at once")
+    parser.add_argument("--max-pending", type=int, help="searches queued for the pool at once (default: twice the workers)")
+    parser.add_argument("--log-dir", default=DEFAULT_LOG_DIR, help="directory for the per-game move logs")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(
+            args.host, args.port, workers=args.workers, movetime_ms=args.movetime, max_games=args.max_games,
+            max_pending=args.max_pending, log_dir=args.log_dir,
+            book=DEFAULT_BOOK if os.path.exists(DEFAULT_BOOK) else None,
+            tablebase=DEFAULT_TABLEBASE if os.path.isdir(DEFAULT_TABLEBASE) else None,
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
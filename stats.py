@@ -0,0 +1,108 @@
+import cProfile
+import json
+import pstats
+import time
+
+# Counters kept by SearchStats, in report order
+COUNTERS = (
+    "nodes",  # Nodes visited by minimax, leaves included
+    "qnodes",  # Nodes visited by quiescence
+    "leaves",  # minimax nodes at depth 0, handed to quiescence or evaluated
+    "evals",  # Static evaluations
+    "cutoffs",  # Alpha-beta cutoffs, in minimax and quiescence
+    "tt_probes",  # Transposition table lookups
+    "tt_hits",  # Lookups that found the position
+    "tt_cutoffs",  # Hits that answered the node without searching it
+    "tb_hits",  # Positions scored from the endgame tablebase
+    "movegen_calls",  # generate_moves calls made by the search, in minimax, quiescence and at the root
+    "mate_tests",  # In-check tests telling mate from stalemate or a fifty-move draw, not move generation's own
+    "make_moves",  # Moves played on the board (each one is unmade again)
+)
+
+
+class SearchStats:
+    """
+    Counters and timings for one search. Each Bot owns one, so searches in different threads or processes
+    never share counters, and parallel_search adds its workers' counts into its own with merge().
+    """
+
+    def __init__(self):
+        self.profiler = None
+        self.reset()
+
+    def reset(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.depths = []  # One entry per completed iterative deepening iteration
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.profile = None  # Busiest functions from the last profiled search, see stop_profile()
+
+    def record_depth(self, depth, score, move):
+        """Note that an iteration finished, with the nodes and time it took."""
+        now = time.perf_counter()
+        previous = self.depths[-1] if self.depths else {"nodes": 0, "qnodes": 0, "elapsed": 0.0}
+        elapsed = now - self.started
+        self.depths.append({
+            "depth": depth,
+            "score": score,
+            "move": move,
+            "nodes": self.nodes - previous["nodes"],
+            "qnodes": self.qnodes - previous["qnodes"],
+            "seconds": round(elapsed - previous["elapsed"], 6),
+            "elapsed": elapsed,
+        })
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+
+    def merge(self, counts):
+        """Add counters from another search, given as the dict from as_dict() (e.g. from a worker process)."""
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + counts.get(name, 0))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in COUNTERS}
+
+    def nps(self):
+        """Nodes, quiescence included, per second of the finished search."""
+        return int((self.nodes + self.qnodes) / self.seconds) if self.seconds > 0 else 0
+
+    def report(self):
+        """Everything measured, as a JSON-ready dict."""
+        report = self.as_dict()
+        report["seconds"] = round(self.seconds, 6)
+        report["nps"] = self.nps()
+        report["depths"] = [
+            {key: (round(value, 6) if key == "elapsed" else value) for key, value in entry.items()}
+            for entry in self.depths
+        ]
+        if self.profile is not None:
+            report["profile"] = self.profile
+        return report
+
+    def to_json(self, indent=2):
+        return json.dumps(self.report(), indent=indent, default=str)
+
+    def start_profile(self):
+        """Run cProfile until stop_profile(), for finding where a search spends its time."""
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self, top=25):
+        """Stop profiling and keep the top functions by own time in self.profile (and the report)."""
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        entries = pstats.Stats(self.profiler).stats
+        self.profiler = None
+        busiest = sorted(entries.items(), key=lambda item: item[1][2], reverse=True)[:top]
+        self.profile = [
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "own_seconds": round(own, 6),
+                "cumulative_seconds": round(cumulative, 6),
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in busiest
+        ]
@@ -0,0 +1,285 @@
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from game import ChessBoard, King, Queen, Rook, Pawn, WHITE, BLACK, PAWN, KNIGHT, BISHOP, KING, COLOR_OFFSET
+
+# Results from the side to move's point of view
+WIN, DRAW, LOSS = 1, 0, -1
+
+# Endings with a table, in build order. KPK needs KQK and KRK for its promotions
+ENDINGS = {"KQK": Queen, "KRK": Rook, "KPK": Pawn}
+DRAWN_KINDS = (KNIGHT, BISHOP)  # King and one minor piece against a bare king can't be won
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+
+# Squares are row * 8 + col, as in game.py. The eight symmetries of the board apply to endings without
+# pawns, and only the left-right mirror to endings with one
+def _transform(flip_rows, flip_cols, transpose):
+    """Square -> square table for one symmetry of the board."""
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        row, col = 7 - row if flip_rows else row, 7 - col if flip_cols else col
+        table.append(col * 8 + row if transpose else row * 8 + col)
+    return tuple(table)
+
+
+_TRANSFORMS = [_transform(t & 1, t & 2, t & 4) for t in range(8)]  # The identity comes first
+_MIRROR = _TRANSFORMS[2]
+# Without pawns the strong king can always be moved into the a1-d1-d4 triangle
+TRIANGLE = [sq for sq in range(64) if sq % 8 <= 3 and 7 - sq // 8 <= sq % 8]
+_TRIANGLE_INDEX = {sq: i for i, sq in enumerate(TRIANGLE)}
+_KING_TRANSFORM = [next(t for t in _TRANSFORMS if t[sq] in _TRIANGLE_INDEX) for sq in range(64)]
+
+# Each table is one byte per position: 0 for a draw (or a position that can't occur), otherwise the number of
+# plies to mate plus one. An odd number of plies means the side to move mates, an even number that it is mated
+
+
+class EndingTable:
+    """
+    Geometry of the table for the strong side's king and piece against a lone king, with the strong side
+    always white. Positions are indexed by (side to move, strong king, weak king, piece) after symmetry
+    reduction, so each is stored once.
+    """
+
+    def __init__(self, name, piece_class):
+        self.name = name
+        self.piece_class = piece_class
+        self.has_pawn = piece_class is Pawn
+        self.king_squares = 64 if self.has_pawn else len(TRIANGLE)
+        self.piece_squares = 32 if self.has_pawn else 64  # The pawn is kept on files a-d
+        self.size = 2 * self.king_squares * 64 * self.piece_squares
+
+    def index(self, white_to_move, wk, bk, piece):
+        """Index of the position with the strong (white) king, weak king and strong piece on these squares."""
+        if self.has_pawn:
+            if piece % 8 >= 4:
+                wk, bk, piece = _MIRROR[wk], _MIRROR[bk], _MIRROR[piece]
+            king_index, piece_index = wk, piece // 8 * 4 + piece % 8
+        else:
+            transform = _KING_TRANSFORM[wk]
+            wk, bk, piece = transform[wk], transform[bk], transform[piece]
+            king_index, piece_index = _TRIANGLE_INDEX[wk], piece
+        return (((0 if white_to_move else 1) * self.king_squares + king_index) * 64 + bk) * self.piece_squares + piece_index
+
+    def squares(self, index):
+        """The (white to move, strong king, weak king, piece) position stored at index."""
+        rest, piece_index = divmod(index, self.piece_squares)
+        rest, bk = divmod(rest, 64)
+        stm, king_index = divmod(rest, self.king_squares)
+        if self.has_pawn:
+            return stm == 0, king_index, bk, piece_index // 4 * 8 + piece_index % 4
+        return stm == 0, TRIANGLE[king_index], bk, piece_index
+
+
+TABLES = {name: EndingTable(name, piece_class) for name, piece_class in ENDINGS.items()}
+
+
+def decode(value):
+    """Turn a stored byte into (result, plies to mate) for the side to move."""
+    if value == 0:
+        return DRAW, 0
+    plies = value - 1
+    return (WIN if plies % 2 else LOSS), plies
+
+
+def generate(table: EndingTable, solved=None, out=None):
+    """
+    Solve every position of an ending by retrograde analysis and return the table as a bytearray.
+
+    Every position is set up on a ChessBoard once to list its legal moves, which gives the move graph.
+    Starting from the checkmates, results then spread backwards through it: a position with a move to a
+    lost position is won, and one whose moves all reach won positions is lost. Going in order of distance
+    to mate makes the first result found for each position the fastest mate, or the slowest defence.
+    solved holds the finished tables that promotions lead into.
+    """
+    solved = solved or {}
+    size = table.size
+    parents = [[] for _ in range(size + 256)]  # Positions 'size + value' stand for results in other tables
+    children_left = [0] * size
+    values = bytearray(size)
+    resolved = bytearray(size)
+    frontier = [[]]  # frontier[plies] lists the positions found to be mated or mating in that many plies
+
+    board = ChessBoard.from_fen("8/8/8/8/8/8/8/8 w - - 0 1")
+    white_king, black_king, piece = King(WHITE), King(BLACK), table.piece_class(WHITE)
+    start = time.perf_counter()
+    for index in range(size):
+        white_to_move, wk, bk, sq = table.squares(index)
+        if len({wk, bk, sq}) < 3 or (table.has_pawn and sq // 8 in (0, 7)):
+            resolved[index] = 1  # Can't occur, left as a draw nobody will look up
+            continue
+        board.put_piece(divmod(wk, 8), white_king)
+        board.put_piece(divmod(bk, 8), black_king)
+        board.put_piece(divmod(sq, 8), piece)
+        color = WHITE if white_to_move else BLACK
+        board.turn = color
+        if board.is_in_check(BLACK if white_to_move else WHITE):  # The side that just moved is in check
+            resolved[index] = 1
+            moves = None
+        else:
+            moves = board.legal_moves(color)
+            if not moves and board.is_in_check(color):
+                resolved[index] = 1
+                values[index] = 1  # Mated, no plies left
+                frontier[0].append(index)
+        for move in moves or ():
+            end = move[1][0] * 8 + move[1][1]
+            if not white_to_move:
+                child = size if end == sq else table.index(True, wk, end, sq)  # Taking the piece leaves a draw
+            elif move[0] == divmod(wk, 8):
+                child = table.index(False, end, bk, sq)
+            elif len(move) == 3:
+                promoted = {"q": "KQK", "r": "KRK"}.get(move[2])
+                child = size + (solved[promoted][TABLES[promoted].index(False, wk, bk, end)] if promoted else 0)
+            else:
+                child = table.index(False, wk, bk, end)
+            parents[child].append(index)
+            children_left[index] += 1
+        for square in (wk, bk, sq):
+            board.remove_piece(divmod(square, 8))
+    if out is not None:
+        print(f"{table.name}: move graph of {size} positions built in {time.perf_counter() - start:.1f}s", file=out)
+
+    # Results from other tables join the frontier at their own distance
+    for value in range(1, 256):
+        if parents[size + value]:
+            plies = value - 1
+            while len(frontier) <= plies:
+                frontier.append([])
+            frontier[plies].append(size + value)
+
+    plies = 0
+    while plies < len(frontier):
+        lost = plies % 2 == 0
+        for child in frontier[plies]:
+            for parent in parents[child]:
+                if resolved[parent]:
+                    continue
+                if not lost:
+                    children_left[parent] -= 1
+                    if children_left[parent]:
+                        continue
+                # A move into a lost position wins, and a position whose every move reaches a won one is lost
+                resolved[parent] = 1
+                values[parent] = plies + 2
+                if plies + 1 == len(frontier):
+                    frontier.append([])
+                frontier[plies + 1].append(parent)
+        plies += 1
+    if out is not None:
+        print(f"{table.name}: solved, longest mate {max(values) - 1} plies", file=out)
+    return values
+
+
+def build(directory=DEFAULT_DIRECTORY, out=sys.stdout):
+    """Generate every table in ENDINGS and write each to directory/<name>.tb."""
+    os.makedirs(directory, exist_ok=True)
+    solved = {}
+    for name, table in TABLES.items():
+        solved[name] = generate(table, solved, out)
+        with open(os.path.join(directory, name + ".tb"), "wb") as f:
+            f.write(solved[name])
+
+
+class Tablebase:
+    """
+    Probes the tables written by build(). Each file is memory-mapped, so opening costs nothing and
+    processes using the same directory share the pages. Endings without a file are simply not covered.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.files = {}
+        self.tables = {}
+        for name, table in TABLES.items():
+            path = os.path.join(directory, name + ".tb")
+            if not os.path.exists(path):
+                continue
+            f = open(path, "rb")
+            if f.seek(0, 2) != table.size:
+                f.close()
+                raise ValueError(f"{path} should be {table.size} bytes")
+            self.files[name] = f
+            self.tables[ENDINGS[name].kind] = (table, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self.max_pieces = 3 if self.tables else 2
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, board: ChessBoard):
+        """
+        Return (result, plies to mate) for the side to move, or None if the position isn't covered.
+        Plies to mate is 0 for a draw.
+        """
+        self.probes += 1
+        occupied = board.occupied
+        count = occupied.bit_count()
+        if count > 3 or any(board._castling_state()):  # With a single pawn there is never an en passant capture
+            return None
+        if count == 2:  # Only the kings left
+            self.hits += 1
+            return DRAW, 0
+
+        bitboards = board.bitboards
+        if not bitboards[KING] or not bitboards[KING + COLOR_OFFSET[BLACK]]:
+            return None
+        for color in (WHITE, BLACK):
+            off = COLOR_OFFSET[color]
+            for kind in range(PAWN, KING):
+                bb = bitboards[kind + off]
+                if not bb:
+                    continue
+                if kind in DRAWN_KINDS:
+                    self.hits += 1
+                    return DRAW, 0
+                if kind not in self.tables:
+                    return None
+                table, data = self.tables[kind]
+                wk = bitboards[KING + off].bit_length() - 1
+                bk = bitboards[KING + COLOR_OFFSET[BLACK if color == WHITE else WHITE]].bit_length() - 1
+                sq = bb.bit_length() - 1
+                white_to_move = board.turn == color
+                if color == BLACK:  # Tables have the strong side as white, so turn the board around
+                    wk, bk, sq = wk ^ 56, bk ^ 56, sq ^ 56
+                self.hits += 1
+                return decode(data[table.index(white_to_move, wk, bk, sq)])
+        return None
+
+    def close(self):
+        for _, data in self.tables.values():
+            data.close()
+        for f in self.files.values():
+            f.close()
+        self.tables, self.files = {}, {}
+        self.max_pieces = 2
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help=f"generate the {', '.join(ENDINGS)} tables")
+    build_parser.add_argument("-o", "--output", default=DEFAULT_DIRECTORY, help="directory to write the tables to")
+    probe = commands.add_parser("probe", help="look a position up")
+    probe.add_argument("fen", help="position to look up")
+    probe.add_argument("-d", "--directory", default=DEFAULT_DIRECTORY, help="directory holding the tables")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build(args.output)
+        return 0
+
+    tablebase = Tablebase(args.directory)
+    found = tablebase.probe(ChessBoard.from_fen(args.fen))
+    tablebase.close()
+    if found is None:
+        print("not in the tablebase")
+    else:
+        result, plies = found
+        print({WIN: f"win, mate in {plies} plies", DRAW: "draw", LOSS: f"loss, mated in {plies} plies"}[result])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
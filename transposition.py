@@ -0,0 +1,56 @@
+# Bound types stored with each score
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Rough size of one stored entry in CPython: the entry tuple plus its 64-bit key and score objects.
+# Moves are 16-bit codes shared with the move lists that produced them, so they aren't counted
+ENTRY_BYTES = 120
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results keyed by the board's Zobrist key.
+
+    Every bucket has two slots. The depth-preferred slot keeps the deepest search seen for the bucket,
+    and is only replaced by a search at least as deep (or by the same position). Anything it turns away
+    goes to the always-replace slot, so recent positions are still found.
+    Entries are (key, depth, flag, score, move) tuples, with flag one of EXACT, LOWER or UPPER.
+    """
+
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        self.buckets = max(1, int(size_mb * 1024 * 1024) // (2 * (ENTRY_BYTES + 8)))
+        self.clear()
+
+    def clear(self):
+        self.depth_slots = [None] * self.buckets
+        self.recent_slots = [None] * self.buckets
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """Return the stored entry for key, or None."""
+        self.probes += 1
+        index = key % self.buckets
+        entry = self.depth_slots[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = self.recent_slots[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        index = key % self.buckets
+        entry = (key, depth, flag, score, move)
+        current = self.depth_slots[index]
+        if current is None or current[0] == key or depth >= current[1]:
+            self.depth_slots[index] = entry
+        else:
+            self.recent_slots[index] = entry
+
+    def usage(self):
+        """Fraction of slots in use."""
+        filled = sum(entry is not None for entry in self.depth_slots) + sum(entry is not None for entry in self.recent_slots)
+        return filled / (2 * self.buckets)
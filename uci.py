@@ -0,0 +1,247 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from bot import Bot, DEFAULT_BOOK, MATE_BOUND, MATE_SCORE, MAX_PLY, NO_MOVE
+from game import ChessBoard, WHITE
+from tablebase import DEFAULT_DIRECTORY as DEFAULT_TABLEBASE
+from transposition import TranspositionTable
+
+ENGINE_NAME = "chess-bot"
+ENGINE_AUTHOR = "chess-bot developers"
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+MOVE_OVERHEAD_MS = 50  # Kept back from the clock for the time it takes to send the move
+DEFAULT_MOVES_TO_GO = 30  # Moves the remaining clock time is shared between when the GUI doesn't say
+
+
+def uci_move(move):
+    """Write a move in UCI notation, e.g. e2e4 or a7a8q."""
+    return ChessBoard.move_to_file_rank(move).lower()
+
+
+def uci_score(score, board: ChessBoard):
+    """Turn a white-positive search score into a UCI score for the side to move, 'cp N' or 'mate N'."""
+    if board.turn != WHITE:
+        score = -score
+    if abs(score) > MATE_BOUND:
+        plies = MATE_SCORE - abs(score)
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+class UciEngine:
+    """
+    Universal Chess Interface front end for Bot. Commands are read on the calling thread, and each 'go'
+    runs the search on a background thread so 'stop', 'isready' and 'quit' are answered while it thinks.
+    """
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.output_lock = threading.Lock()
+        self.bot = Bot(
+            tt_size_mb=DEFAULT_HASH_MB,
+            book=DEFAULT_BOOK if os.path.exists(DEFAULT_BOOK) else None,
+            tablebase=DEFAULT_TABLEBASE if os.path.isdir(DEFAULT_TABLEBASE) else None,
+        )
+        # Forking while the main thread sits in a read on stdin would copy its lock into the workers, which
+        # then hang closing stdin. Spawned workers start from a fresh interpreter instead
+        self.bot.pool_context = multiprocessing.get_context("spawn")
+        self.threads = 1
+        self.board = ChessBoard()
+        self.base = "startpos"  # What the last position command started from, and the moves it played
+        self.moves = []
+        self.search_thread = None
+        self.commands = {
+            "uci": self.cmd_uci,
+            "isready": self.cmd_isready,
+            "setoption": self.cmd_setoption,
+            "ucinewgame": self.cmd_ucinewgame,
+            "position": self.cmd_position,
+            "go": self.cmd_go,
+            "stop": self.cmd_stop,
+        }
+
+    def send(self, line):
+        with self.output_lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+    def run(self, stream=sys.stdin):
+        for line in stream:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "quit":
+                break
+            command = self.commands.get(words[0])
+            if command is None:
+                self.send(f"info string unknown command {words[0]}")
+                continue
+            try:
+                command(words[1:])
+            except ValueError as e:
+                self.send(f"info string {e}")
+        self.cmd_stop([])
+        self.bot.close()
+
+    def cmd_uci(self, words):
+        self.send(f"id name {ENGINE_NAME}")
+        self.send(f"id author {ENGINE_AUTHOR}")
+        self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+        self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+        self.send("uciok")
+
+    def cmd_isready(self, words):
+        self.send("readyok")
+
+    def cmd_setoption(self, words):
+        # setoption name <id> [value <x>], where the name may have spaces
+        text = " ".join(words)
+        if not text.startswith("name "):
+            raise ValueError("usage: setoption name NAME value VALUE")
+        name, _, value = text[len("name "):].partition(" value ")
+        name = name.strip().lower()
+        self.wait()
+        if name == "hash":
+            self.bot.tt = TranspositionTable(max(1, min(int(value), MAX_HASH_MB)))
+        elif name == "threads":
+            self.threads = max(1, min(int(value), MAX_THREADS))  # parallel_search restarts its pool at the new size
+        else:
+            raise ValueError(f"unknown option {name}")
+
+    def cmd_ucinewgame(self, words):
+        self.wait()
+        self.bot.tt.clear()
+        self.base, self.moves = "startpos", []
+        self.board = ChessBoard()
+
+    def cmd_position(self, words):
+        """
+        position startpos|fen FEN [moves MOVE...]. When the new position is the last one with more moves
+        played on top, as GUIs send during a game, only the new moves are played instead of starting over.
+        """
+        if "moves" in words:
+            split = words.index("moves")
+            setup, moves = words[:split], words[split + 1:]
+        else:
+            setup, moves = words, []
+        if setup == ["startpos"]:
+            base = "startpos"
+        elif setup and setup[0] == "fen":
+            base = " ".join(setup[1:])
+        else:
+            raise ValueError("usage: position startpos|fen FEN [moves MOVE...]")
+
+        self.wait()
+        if base != self.base or moves[:len(self.moves)] != self.moves:
+            self.board = ChessBoard() if base == "startpos" else ChessBoard.from_fen(base)
+            self.base, self.moves = base, []
+        for text in moves[len(self.moves):]:
+            move = ChessBoard.file_rank_to_move(text)
+            if move not in self.board.legal_moves():
+                raise ValueError(f"illegal move {text}")
+            self.board.make_move(move)
+            self.moves.append(text)
+
+    def cmd_go(self, words):
+        """go [depth N] [movetime MS] [wtime MS btime MS winc MS binc MS movestogo N] [nodes N] [infinite]"""
+        options = {}
+        i = 0
+        while i < len(words):
+            if words[i] == "infinite":
+                options["infinite"] = True
+                i += 1
+            elif i + 1 < len(words):
+                options[words[i]] = int(words[i + 1])
+                i += 2
+            else:
+                raise ValueError(f"bad go option {words[i]}")
+
+        depth = options.get("depth", MAX_PLY)
+        time_limit_ms = options.get("movetime")
+        if time_limit_ms is None and not options.get("infinite"):
+            clock = options.get("wtime" if self.board.turn == WHITE else "btime")
+            if clock is not None:
+                increment = options.get("winc" if self.board.turn == WHITE else "binc", 0)
+                budget = clock // options.get("movestogo", DEFAULT_MOVES_TO_GO) + increment // 2
+                time_limit_ms = max(1, min(budget, clock - MOVE_OVERHEAD_MS))
+
+        self.wait()
+        board = self.board.clone()  # The search plays moves on its board, so later commands can't disturb it
+        if self.threads > 1 and "depth" in options and not ({"movetime", "wtime", "btime", "nodes"} & options.keys()):
+            target = self.parallel_worker
+            args = (board, depth)
+        else:
+            target = self.search_worker
+            args = (board, depth, time_limit_ms, options.get("nodes"))
+        self.search_thread = threading.Thread(target=target, args=args, daemon=True)
+        self.search_thread.start()
+
+    def search_worker(self, board, depth, time_limit_ms, node_limit):
+        stats = self.bot.stats
+
+        def report(iteration_depth, score, move):
+            elapsed = time.perf_counter() - stats.started
+            nodes = stats.nodes + stats.qnodes
+            pv = self.bot.principal_variation(board, iteration_depth) or ([move] if move != NO_MOVE else [])
+            self.send(
+                f"info depth {iteration_depth} score {uci_score(score, board)} nodes {nodes} "
+                f"nps {int(nodes / elapsed) if elapsed > 0 else 0} time {int(elapsed * 1000)} "
+                f"pv {' '.join(uci_move(m) for m in pv)}".rstrip()
+            )
+
+        self.bot.iteration_hook = report
+        try:
+            _, move = self.bot.search(board, time_limit_ms=time_limit_ms, max_depth=depth, node_limit=node_limit)
+        finally:
+            self.bot.iteration_hook = None
+        self.send_bestmove(board, move)
+
+    def parallel_worker(self, board, depth):
+        """Fixed-depth search split across self.threads processes. It can't be stopped part way through."""
+        score, move = self.bot.parallel_search(board, depth, self.threads)
+        stats = self.bot.stats
+        nodes = stats.nodes + stats.qnodes
+        if move != NO_MOVE:
+            self.send(
+                f"info depth {depth} score {uci_score(score, board)} nodes {nodes} nps {stats.nps()} "
+                f"time {int(stats.seconds * 1000)} pv {uci_move(move)}"
+            )
+        self.send_bestmove(board, move)
+
+    def send_bestmove(self, board, move):
+        """
+        Send the search's move. The null move 0000 forfeits the game in most harnesses, so it is only sent when the
+        position has no legal moves; should the search ever come back empty otherwise, the first legal move goes.
+        """
+        if move in (None, NO_MOVE):
+            legal = board.legal_moves()
+            move = legal[0] if legal else NO_MOVE
+        self.send(f"bestmove {uci_move(move) if move != NO_MOVE else '0000'}")
+
+    def cmd_stop(self, words):
+        if self.search_thread is not None:
+            while self.search_thread.is_alive():  # Repeated in case the search hadn't started yet and missed it
+                self.bot.stop()
+                self.search_thread.join(0.05)
+            self.search_thread = None
+
+    def wait(self):
+        """Let a running search finish (it has sent its bestmove once this returns)."""
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def main():
+    UciEngine().run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())